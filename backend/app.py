@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.sql.expression import func
@@ -6,23 +6,43 @@ import os
 from dotenv import load_dotenv
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
-from spotify_utils import fetch_and_store_spotify_tracks
+from spotify_utils import (fetch_and_store_spotify_tracks, track_listeners, song_write_listeners,
+                           artist_write_listeners, configure_storage, format_artists)
+from feature_store import FeatureStore, FeatureSnapshot, CatalogNotReady
+from ranking import top_k, batch_top_k
+from sampling import IdPool, sample_ids
+from lastfm_utils import get_similar_artists_many, similar_artists_cache
+from migrations import ensure_indexes
+from model_artifacts import save_artifacts, load_artifacts, current_version, save_delta, load_deltas, last_delta_seq
+from catalog_loader import read_song_catalog
+from artist_index import ArtistIndex
+from appendable_rows import AppendableRows
+from search_utils import SongSearchIndex, ArtistSearchIndex, BackgroundIndex
+from preference_model import PreferenceModels
+from jobs import Job, JobRunner, JobQueueFull
+from session_store import session_store
+from song_cache import SongMetadataCache, DETAIL_FIELDS, combined_etag
+from cache_utils import redis_client_from_env
+from fast_json import FastJSONProvider, iter_json_list
+from metrics import registry, request_seconds, stage
+from logging_utils import configure_logging
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
 from sklearn.preprocessing import StandardScaler
 import random
-import requests
+import logging
+import threading
+import time
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics.pairwise import euclidean_distances
 from sklearn.cluster import KMeans
 from sklearn.pipeline import Pipeline
 import numpy as np
 import pandas as pd
-from sqlalchemy import select
+from sqlalchemy import select, text, bindparam
 
 load_dotenv()
 
@@ -30,6 +50,10 @@ auth_manager = SpotifyClientCredentials(client_id=os.getenv('SPOTIPY_CLIENT_ID')
 sp = spotipy.Spotify(auth_manager=auth_manager)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+
+# Structured, LOG_LEVEL-gated logging instead of prints on the request paths
+log = configure_logging()
 
 # Database configuration - Replace with your actual credentials
 app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
@@ -82,22 +106,95 @@ class Artist(db.Model):
     def to_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
+# Bulk writes from spotify_utils.store_tracks go straight to the tables
+with app.app_context():
+    configure_storage(db.engine, Song.__table__, Artist.__table__)
+
+# Process-wide song ids + feature matrix, loaded once with the catalog below
+feature_store = FeatureStore(wait_timeout=float(os.getenv('CATALOG_WAIT_SECONDS', 10)))
+
+# Artist primary keys for random sampling, loaded on first use
+artist_id_pool = IdPool(lambda: [row[0] for row in db.session.query(Artist.artist_id)])
+
+def add_artists(artists):
+    # store_tracks upserts artists ({artist_id, artist_name} rows) along with the songs:
+    # add the new ones to the id pool and the search index instead of reloading both
+    added = artist_id_pool.add([artist['artist_id'] for artist in artists])
+    if added:
+        names = {artist['artist_id']: artist['artist_name'] for artist in artists}
+        artist_search.update(lambda index: index.extended(added, [names[a] for a in added]))
+
+artist_write_listeners.append(add_artists)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(time.perf_counter() - start, endpoint, request.method, str(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Features used to build a user profile from swipe results
+profile_features = ['danceability', 'energy', 'key', 'loudness', 'speechiness',
+                    'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo']
+
+# Columns /song-search returns, the audio features are left out
+song_search_columns = [Song.id, Song.name, Song.album, Song.artist_ids, Song.artists, Song.track_number,
+                       Song.disc_number, Song.explicit, Song.duration_ms, Song.year]
+artist_columns = [Artist.artist_id, Artist.artist_name]
+
+def select_dicts(columns, *where, order_by=(), limit=None):
+    # Only the given columns as plain dicts, straight from the rows without ORM objects
+    query = select(*columns).where(*where).order_by(*order_by).limit(limit)
+    return [row._asdict() for row in db.session.execute(query)]
+
+def fetch_in_order(columns, key_column, keys):
+    # Rows whose key is in keys (as select_dicts), in the order of keys
+    rows = {row[key_column.key]: row for row in select_dicts(columns, key_column.in_(keys))}
+    return [rows[key] for key in keys if key in rows]
+
+def load_song_metadata(song_ids):
+    with stage('db_fetch'):
+        return select_dicts([getattr(Song, f) for f in DETAIL_FIELDS], Song.id.in_(song_ids))
+
+# Serialized song metadata for /songs/<id> and /songs/by-ids, dropped whenever store_tracks writes
+song_metadata = SongMetadataCache(load_song_metadata, app.json.dumps, redis_client_from_env())
+song_write_listeners.append(song_metadata.invalidate)
+
+registry.gauge('tuneswipe_catalog_songs', 'Songs in the resident catalog',
+               lambda: len(feature_store.snapshot()) if feature_store.loaded else 0)
+registry.gauge('tuneswipe_cache', 'Cache hits, misses and size', lambda: {
+    (cache, stat): value
+    for cache, stats in [('song_metadata', song_metadata.stats()), ('similar_artists', similar_artists_cache.stats())]
+    for stat, value in stats.items()
+}, ['cache', 'stat'])
+
+# /songs/by-ids streams its body from this many songs on
+json_stream_min_items = int(os.getenv('JSON_STREAM_MIN_ITEMS', 500))
+
+def cached_json_response(body, etag, status=200):
+    response = app.response_class(body, status=status, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
 #Get song by ID
 @app.route('/songs/<string:song_id>', methods=['GET'])
 def get_song_by_id(song_id):
-    song = Song.query.get(song_id)  # Use primary key lookup
+    entry = song_metadata.get(song_id)
 
-    if song:
-        return jsonify({
-            'id': song.id,
-            'name': song.name,
-            'album': song.album,
-            'artist_ids': song.artist_ids,
-            'track_number': song.track_number,
-            'explicit': song.explicit,
-            'year': song.year,
-            # Add more fields as needed
-        })
+    if entry:
+        if entry['etag'] in request.if_none_match:
+            return cached_json_response('', entry['etag'], 304)
+        return cached_json_response(entry['detail'], entry['etag'])
     else:
         return jsonify({'error': 'Song not found'}), 404
 
@@ -109,22 +206,24 @@ def get_songs_by_ids():
     if not ids:
         return jsonify({'error': 'No song IDs provided'}), 400
 
-    songs = Song.query.filter(Song.id.in_(ids)).all()
+    # Multi-get from the cache, one query for whatever is missing
+    entries = [entry for entry in song_metadata.get_many(ids).values() if entry]
+    etag = combined_etag(entries)
+    if etag in request.if_none_match:
+        # Unchanged, skip building the body
+        return cached_json_response('', etag, 304)
 
-    return jsonify([
-        {
-            'id': song.id,
-            'name': song.name,
-            'album': song.album,
-            'artist_ids': song.artist_ids,
-            'year': song.year,
-        }
-        for song in songs
-    ])
+    summaries = (entry['summary'] for entry in entries)
+    if len(entries) >= json_stream_min_items:
+        # Large lists go out in pieces instead of as one joined body
+        return cached_json_response(iter_json_list(summaries, app.json.dumps), etag)
+    return cached_json_response('[' + ','.join(summaries) + ']', etag)
 
 @app.route('/random-song', methods=['GET'])
 def get_random_song():
-    song = Song.query.order_by(func.random()).first()  # Random row from songs table
+    # Pick a random id from the resident catalog instead of sorting the table by random()
+    song_ids = sample_ids(feature_store.snapshot().ids, 1)
+    song = Song.query.get(song_ids[0]) if song_ids else None
     if song:
         return jsonify({
             'id': song.id,
@@ -140,12 +239,11 @@ def get_random_song():
 def get_swipe_recommendations():
     try:
         user_info = request.get_json()
+        seen_ids = user_info.get('seen', [])
 
-        songs = Song.query.order_by(func.random()).limit(20).all()
-
-        # Only return song IDs
-        song_ids = [song.id for song in songs]
-        print(song_ids)
+        # Only return song IDs, sampled from the resident catalog and skipping songs already seen
+        song_ids = sample_ids(feature_store.snapshot().ids, 20, exclude=seen_ids)
+        log.debug("swipe recommendations", extra={"song_ids": song_ids})
         return jsonify(song_ids), 200
     except Exception as e:
         return jsonify([]), 500
@@ -224,23 +322,13 @@ def create_playlist():
 
     liked_ids = [item['id'] for item in swipeResults if item['liked']]
 
-    # Query liked song features
-    liked_song_features = db.session.query(
-        Song.id,
-        Song.danceability,
-        Song.energy,
-        Song.key,
-        Song.loudness,
-        Song.speechiness,
-        Song.acousticness,
-        Song.instrumentalness,
-        Song.liveness,
-        Song.valence,
-        Song.tempo,
-    ).filter(Song.id.in_(liked_ids)).all()
-
-    # Build numpy array of liked features (excluding ID)
-    liked_feature_vectors = np.array([row[1:] for row in liked_song_features])
+    # All song features come from the resident feature store
+    catalog = feature_store.snapshot()
+    all_ids = catalog.ids
+    all_vectors = catalog.view(profile_features)
+
+    # Build numpy array of liked features
+    liked_feature_vectors = all_vectors[catalog.rows(liked_ids)]
 
     # Compute average user profile
     if len(liked_feature_vectors) == 0:
@@ -248,112 +336,167 @@ def create_playlist():
 
     user_profile = liked_feature_vectors.mean(axis=0).reshape(1, -1)
 
-    # Query all songs in the database
-    all_song_features = db.session.query(
-        Song.id,
-        Song.danceability,
-        Song.energy,
-        Song.key,
-        Song.loudness,
-        Song.speechiness,
-        Song.acousticness,
-        Song.instrumentalness,
-        Song.liveness,
-        Song.valence,
-        Song.tempo,
-    ).all()
-
-    # Build array of all features (and keep track of IDs)
-    all_ids = [row[0] for row in all_song_features]
-    all_vectors = np.array([row[1:] for row in all_song_features])
-
     # Compute cosine similarity
-    similarities = cosine_similarity(all_vectors, user_profile).flatten()
-
-    # Rank top 30 songs by similarity (excluding liked songs if desired)
-    ranked_indices = similarities.argsort()[::-1]
+    with stage('similarity'):
+        similarities = all_vectors.apply(lambda vectors: cosine_similarity(vectors, user_profile).ravel())
 
-    # Optionally exclude songs already rated
-    filtered_indices = [i for i in ranked_indices if all_ids[i] not in liked_ids]
-
-    # Get top 30 recommendations
-    top_30_ids = [all_ids[i] for i in filtered_indices[:30]]
+    # Get top 30 recommendations by similarity, excluding songs already liked
+    with stage('top_k'):
+        top_30_indices = top_k(similarities, 30, exclude=catalog.mask(liked_ids))
+    top_30_ids = all_ids[top_30_indices].tolist()
 
     # Return or use these IDs however you like
     return jsonify(top_30_ids)
 
-@app.route('/logregression', methods=['GET'])
+def liked_song_ids(activityLog):
+    # Liked ids of one batch entry, ValueError describes a malformed one
+    if not isinstance(activityLog, dict):
+        raise ValueError("Activity log must be an object")
+    swipeResults = activityLog.get('swipeResults', [])
+    if not isinstance(swipeResults, list):
+        raise ValueError("swipeResults must be a list")
+    liked = []
+    for item in swipeResults:
+        if not isinstance(item, dict) or not isinstance(item.get('id'), str) or 'liked' not in item:
+            raise ValueError("Each swipe result needs a string id and liked")
+        if item['liked']:
+            liked.append(item['id'])
+    return liked
+
+@app.route('/create-playlists/batch', methods=['POST'])
+def create_playlists_batch():
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return {"error": "Request body must be an object"}, 400
+    activity_logs = data.get('activityLogs', [])
+    k = data.get('k', 30)
+
+    if not activity_logs:
+        return {"error": "No activity logs provided"}, 400
+    if not isinstance(activity_logs, list):
+        return {"error": "activityLogs must be a list"}, 400
+    if not isinstance(k, int) or k <= 0:
+        return {"error": "k must be a positive integer"}, 400
+
+    catalog = feature_store.snapshot()
+    all_vectors = catalog.view(profile_features)
+
+    # Same profile as create_playlist: the mean of each user's liked songs.
+    # A malformed entry only gets an error in its own slot
+    playlists = [{"error": "No liked songs to build user profile."} for _ in activity_logs]
+    positions = []
+    profiles = []
+    liked_rows = []
+    for position, activityLog in enumerate(activity_logs):
+        try:
+            rows = catalog.rows(liked_song_ids(activityLog))
+        except ValueError as e:
+            playlists[position] = {"error": str(e)}
+            continue
+        if len(rows) == 0:
+            continue
+        positions.append(position)
+        profiles.append(all_vectors[rows].mean(axis=0))
+        liked_rows.append(rows)
+
+    if profiles:
+        # Score every profile against the unit-length song matrix in chunked matmuls
+        profiles = np.array(profiles, dtype=np.float32)
+        norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        profiles /= norms
+
+        with stage('batch_similarity'):
+            top_rows = batch_top_k(catalog.unit_view(profile_features), profiles, k, exclude_rows=liked_rows)
+        for position, rows in zip(positions, top_rows):
+            playlists[position] = {"playlist": catalog.ids[rows].tolist()}
+
+    return jsonify(playlists)
+
+# Per-user preference models, updated from swipes instead of refit on every request.
+# With REDIS_URL every worker can answer for every user
+preference_models = PreferenceModels(max_size=int(os.getenv('PREFERENCE_MODELS_MAX', 10000)),
+                                     ttl=int(os.getenv('PREFERENCE_MODELS_TTL', 24 * 3600)),
+                                     redis_client=redis_client_from_env())
+
+@app.route('/logregression', methods=['GET', 'POST'])
 def logregression():
-    results = db.session.query(
-        Song.id,
-        Song.danceability,
-        Song.energy,
-        Song.key,
-        Song.loudness,
-        Song.speechiness,
-        Song.acousticness,
-        Song.instrumentalness,
-        Song.liveness,
-        Song.valence,
-        Song.tempo,
-        Song.time_signature
-    ).all()
-    # Define the ID you're looking for
-    target_ids = ["0qOnSQQF0yzuPWsXrQ9paz", "3bfqkspKABT4pPicm6wC9F"]
-    indices = [i for i, t in enumerate(results) if t[0] in target_ids]
-
-    print("Indices:", indices)
-
-    matrix_data = [
-    song[1:]  # Exclude the first element (the 'id' column)
-    for song in results
-    ]
-    data_matrix = np.array(matrix_data)
-    columns = [
-    'danceability',
-    'energy',
-    'key',
-    'loudness',
-    'speechiness',
-    'acousticness',
-    'instrumentalness',
-    'liveness',
-    'valence',
-    'tempo',
-    'time_signature'
-    ]
-
-    # Create DataFrame
-    df = pd.DataFrame(data_matrix, columns=columns)
-    selected_rows = df.iloc[indices]
-    # Optionally exclude already selected rows from top 28
-    extra_rows = df.head(1)
-    X_train = pd.concat([selected_rows, extra_rows], ignore_index=True)
-    n = 3
-    target = [1, 1] + [0] * (n - 2)
-    y_train = pd.DataFrame({'target': target})
-
-    model = LogisticRegression()
-    # Train the model
-    model.fit(X_train, y_train)
-    y_pred = model.predict_proba(data_matrix)
-    probs_class_1 = y_pred[:, 1]
-    top_30_indices = np.argsort(probs_class_1)[-30:][::-1]
-
-    top_30_ids = [results[i][0] for i in top_30_indices]
+    # POST {"activityLog": {"user_id", "swipeResults"}} learns the new swipes first,
+    # GET ?user_id= scores the user's current model
+    catalog = feature_store.snapshot()
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        activityLog = data.get('activityLog', {})
+        user_id = data.get('user_id') or activityLog.get('user_id')
+        if not user_id:
+            return {"error": "user_id is required"}, 400
+        model = preference_models.get_or_create(user_id, catalog)
+        with stage('model_update'):
+            batches = model.batches
+            model.update(catalog, activityLog.get('swipeResults', []))
+            if model.batches != batches:
+                preference_models.save(user_id, model)
+    else:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return {"error": "user_id is required"}, 400
+        model = preference_models.get(user_id, catalog)
+        if model is None:
+            return {"error": "No swipes recorded for this user"}, 404
+
+    if not model.trained:
+        return {"error": "No swiped songs found in the catalog"}, 400
+
+    # Top 30 by predicted preference, leaving out songs the user already swiped
+    with stage('model_scoring'):
+        scores = model.scores(catalog)
+        top_30_indices = top_k(scores, 30, exclude=catalog.mask(model.swiped_ids()))
+    top_30_ids = catalog.ids[top_30_indices].tolist()
 
     return jsonify({"message": top_30_ids})
 
+def search_fallback_order(column, query):
+    # Used while the in-process index is building: prefix matches first, then shorter names
+    return [column.ilike(f'{query}%').desc(), func.length(column)]
+
+def build_artist_search_index(_):
+    with app.app_context():
+        artists = db.session.query(Artist.artist_id, Artist.artist_name).all()
+    return ArtistSearchIndex([a[0] for a in artists], [a[1] for a in artists])
+
+def build_song_search_index(catalog):
+    return SongSearchIndex(catalog.ids, catalog.name_codes, catalog.names.tolist())
+
+def extend_song_search_index(index, built_for, catalog):
+    # Snapshots grown from the indexed one by appends share its loaded arrays
+    if catalog.ids.base is not built_for.ids.base or len(catalog) < len(built_for):
+        return None
+    return index.extended(catalog.ids, catalog.name_codes, catalog.names)
+
+# In-process name indexes, built in the background and extended as songs and artists are added
+song_search = BackgroundIndex(build_song_search_index, extend_song_search_index)
+artist_search = BackgroundIndex(build_artist_search_index)
+
 @app.route('/artist-search', methods=['GET'])
 def get_artist_by_name():
     query = request.args.get('query', '').lower()
     if not query:
         return jsonify({"error": "Query parameter is required"}), 400
-
-    artists = Artist.query.filter(Artist.artist_name.ilike(f'%{query}%')).limit(50).all()
+    prefix_only = request.args.get('prefix', '').lower() in ('1', 'true')
+
+    index = artist_search.get(artist_id_pool.ids())
+    if index is not None:
+        with stage('search_index'):
+            artist_ids = index.search(query, 50, prefix_only)
+        with stage('db_fetch'):
+            artists = fetch_in_order(artist_columns, Artist.artist_id, artist_ids)
+    else:
+        pattern = f'{query}%' if prefix_only else f'%{query}%'
+        artists = select_dicts(artist_columns, Artist.artist_name.ilike(pattern),
+                               order_by=search_fallback_order(Artist.artist_name, query), limit=50)
 
     if artists:
-        return jsonify([artist.to_dict() for artist in artists]), 200
+        return jsonify(artists), 200
     return jsonify([]), 200
 
 @app.route('/song-search', methods=['GET'])
@@ -361,23 +504,34 @@ def get_song_by_name():
     query = request.args.get('query', '').lower()
     if not query:
         return jsonify({"error": "Query parameter is required"}), 400
-
-    songs = Song.query.filter(Song.name.ilike(f'%{query}%')).limit(50).all()
+    prefix_only = request.args.get('prefix', '').lower() in ('1', 'true')
+
+    index = song_search.get(feature_store.snapshot()) if feature_store.loaded else None
+    if index is not None:
+        with stage('search_index'):
+            song_ids = index.search(query, 50, prefix_only)
+        with stage('db_fetch'):
+            songs = fetch_in_order(song_search_columns, Song.id, song_ids)
+    else:
+        pattern = f'{query}%' if prefix_only else f'%{query}%'
+        songs = select_dicts(song_search_columns, Song.name.ilike(pattern),
+                             order_by=search_fallback_order(Song.name, query), limit=50)
 
     if songs:
-        return jsonify([song.to_dict() for song in songs]), 200
+        return jsonify(songs), 200
     return jsonify([]), 200
 
 
 @app.route('/test', methods=['GET'])
 def get_random_artist():
-    artist = Artist.query.order_by(func.random()).first()
+    artist_ids = artist_id_pool.sample(1)
+    artist = Artist.query.get(artist_ids[0]) if artist_ids else None
     if artist:
         return jsonify(artist.to_dict()), 200
     return jsonify({"error": "No artist found"}), 404
 
-# Global variable to store the similar artists data
-similar_artists_data = {}
+# Artists each user sent to /recent-tracks, read back by /random-artists
+similar_artists_data = session_store('similar-artists')
 
 # Get Recent Tracks From A User
 @app.route('/recent-tracks', methods=['POST'])
@@ -390,45 +544,13 @@ def get_recent_tracks():
   if not user_id or not artists:
       return {"error": "Missing user_id or artists"}, 400
 
-  # Process the user_id and artists
-  print("User ID:", user_id)
-  print("Artists:", artists)
+  log.debug("recent tracks received", extra={"user_id": user_id, "artists": artists})
 
-  print("message: Data received successfully")
-
-  # Store the result in the global variable
-  global similar_artists_data
-  similar_artists_data[user_id] = artists
+  # Store the result in the session store
+  similar_artists_data.set(user_id, artists)
 
   return jsonify(artists), 200
 
-#Get Similar Artists with LastFM API
-def get_similar_artists(artist_name):
-  if not artist_name:
-      return {"error": "Missing artist_name"}, 400
-
-  # Process the artist_name
-  # print("Artist Name:", artist_name)
-
-  # Call LastFM API to get similar artists
-  api_key = os.getenv('LASTFM_API_KEY')
-  url = "http://ws.audioscrobbler.com/2.0/"
-  params = {
-        "method": "artist.getsimilar",
-        "artist": artist_name,
-        "api_key": api_key,
-        "format": "json",
-        "limit": 10
-  }
-
-  response = requests.get(url, params=params)
-
-  if response.status_code == 200:
-      similar_artists = response.json()
-      return similar_artists
-  else:
-      return {"error": "Failed to fetch similar artists"}, response.status_code
-
 # Batch Similar Artists into a single request
 def batch_similar_artists(artists):
     artists = artists.get('artists')
@@ -436,62 +558,65 @@ def batch_similar_artists(artists):
     if not artists:
         return {"error": "Missing artists list"}, 400
 
-    all_similar = {}
-
+    artist_names = []
     for artist_entry in artists:
         if isinstance(artist_entry, list):
-            artist_name = artist_entry[0]  # Take first name of list
+            artist_names.append(artist_entry[0])  # Take first name of list
         else:
-            artist_name = artist_entry
+            artist_names.append(artist_entry)
 
-        similar_result = get_similar_artists(artist_name)
-        if similar_result:
-            # Extract just the names of the similar artists
-            similar_artists_names = [artist['name'] for artist in similar_result.get('similarartists', {}).get('artist', [])]
-            all_similar[artist_name] = similar_artists_names  # Store just the names
-        else:
-            all_similar[artist_name] = {"error": "Failed to fetch similar artists"}
+    # Fetch all artists concurrently, failed or timed out lookups contribute no names
+    with stage('lastfm'):
+        similar_results = get_similar_artists_many(artist_names)
+    all_similar = {}
+    for artist_name, similar_result in similar_results.items():
+        if isinstance(similar_result, tuple):
+            all_similar[artist_name] = []
+            continue
+        # Extract just the names of the similar artists
+        similar_artists_names = [artist['name'] for artist in similar_result.get('similarartists', {}).get('artist', [])]
+        all_similar[artist_name] = similar_artists_names  # Store just the names
 
-    print("All similar artists:", all_similar)
+    log.debug("similar artists", extra={"similar_artists": all_similar})
 
     return all_similar
 
+# One (name, id) credit per artist name that appears on at least one song
+artist_credits_query = text("""
+    SELECT DISTINCT ON (credit.artist_name) credit.artist_name, credit.artist_id
+    FROM songs, unnest(songs.artists, songs.artist_ids) AS credit(artist_name, artist_id)
+    WHERE songs.artists && :names AND credit.artist_name = ANY(:names)
+""").bindparams(bindparam('names', type_=ARRAY(db.Text)))
+
 def check_songs(similar_artists, disliked_artists):
     if not similar_artists:
         return {"error": "No similar artists provided"}, 400
 
-    artist_names = []  # To store artist names
-    artist_ids = []  # To store artist IDs
-
-    for artist, similar_list in similar_artists.items():
-        # Filter out disliked artists from the similar list
-
-        filtered_similar_list = []
-        for artist_name in similar_list:
-            # Query the database to get the artist ID for the current artist name
-            artist_entry = Artist.query.filter_by(artist_name=artist_name).first()
-            if artist_entry and artist_entry.artist_id not in disliked_artists:
-                filtered_similar_list.append(artist_name)
-
-        for similar_artist in filtered_similar_list:
-            # Query the database to check if the artist exists
-            song = Song.query.filter(Song.artists.any(similar_artist)).first()
-
-            if song is not None:
-                artist_names.append(similar_artist)  # Add the artist name to the list
-                try:
-                    # Find the matching index
-                    idx = song.artists.index(similar_artist)
-                    # Use the same index to get the artist ID
-                    artist_id = song.artist_ids[idx]
-                    artist_ids.append(artist_id)
-                except ValueError:
-                    # If somehow artist not found, skip it
-                    continue
+    # Every similar artist name across all seed artists, resolved in bulk below
+    candidate_names = list(dict.fromkeys(name for similar_list in similar_artists.values() for name in similar_list))
+    if not candidate_names:
+        return []
+
+    # One query for the artist IDs of all names, then filter disliked artists in memory
+    disliked = set(disliked_artists)
+    artist_entries = {}
+    with stage('db_fetch'):
+        artist_rows = db.session.query(Artist.artist_name, Artist.artist_id).filter(Artist.artist_name.in_(candidate_names)).all()
+    for artist_name, artist_id in artist_rows:
+        artist_entries.setdefault(artist_name, artist_id)
+    filtered_names = [name for name in candidate_names if name in artist_entries and artist_entries[name] not in disliked]
+    if not filtered_names:
+        return []
+
+    # One query for which of them appear on a song, taking the artist ID at the same
+    # position of the song's artist_ids (the && filter can use the GIN index on songs.artists)
+    with stage('db_fetch'):
+        credits = db.session.execute(artist_credits_query, {"names": filtered_names}).all()
+    artist_names = [artist_name for artist_name, _ in credits]
 
     # Remove duplicates from the artist IDs
-    unique_artist_ids = list(set(artist_ids))
-    print("Unique artist names found in the database:", artist_names)
+    unique_artist_ids = list({artist_id for _, artist_id in credits})
+    log.debug("artists found in the database", extra={"artist_names": artist_names})
     # print("Unique artist IDs found in the database:", unique_artist_ids)
     return unique_artist_ids
 
@@ -502,26 +627,20 @@ def select_random_artists(all_artists):
         random_artists = random.sample(all_artists, 15)
     return random_artists
 
-@app.route('/random-artists', methods=['POST'])
-def get_random_artists():
-    global similar_artists_data
-
-    # Extract user_id (Spotify ID) from query parameters
-    data = request.get_json()
+def random_artists_for(data):
+    # Body of /random-artists, shared with its background job. Returns (result, status)
     user_id = data.get('user_id')
     disliked_artists = data.get('disliked_artists', [])
     if not user_id:
         return {"error": "Missing user_id in the request"}, 400
 
-    print(f"Disliked artists for user_id {user_id}: {disliked_artists}")
+    log.debug("random artists requested", extra={"user_id": user_id, "disliked_artists": disliked_artists})
 
-    # Check if the user_id exists in similar_artists_data
-    if user_id not in similar_artists_data:
+    # Fetch the artists for the user
+    artists = similar_artists_data.get(user_id)
+    if artists is None:
         return {"error": f"No data available for user_id: {user_id}"}, 400
-
-     # Fetch the artists for the user
-    artists = similar_artists_data[user_id]
-    print(f"Fetched artists for user_id {user_id}: {artists}")
+    log.debug("fetched session artists", extra={"user_id": user_id, "artists": artists})
 
     # Batch similar artists into a dictionary
     similar_artists = batch_similar_artists({"artists": artists})
@@ -538,8 +657,14 @@ def get_random_artists():
     if isinstance(random_artists, dict) and "error" in random_artists:
         return random_artists, 400
 
-    print(f"10 Random artists for user_id {user_id}: {random_artists}")
-    return jsonify(random_artists), 200
+    log.debug("random artists", extra={"user_id": user_id, "random_artists": random_artists})
+    return random_artists, 200
+
+@app.route('/random-artists', methods=['POST'])
+def get_random_artists():
+    # Extract user_id (Spotify ID) from query parameters
+    result, status = random_artists_for(request.get_json())
+    return jsonify(result), status
 
 # ---------------- K-Means Clustering ------------------
 # Define features and metadata columns
@@ -548,35 +673,259 @@ features = ['valence', 'year', 'acousticness', 'danceability', 'duration_ms',
             'loudness', 'mode', 'speechiness', 'tempo']
 metadata_cols = ['year', 'name']
 
+# K-Means clusters probed per playlist, more probes trade latency for recall. Exact search
+# (0) by default, compare music_recommender_by_artist_ivf with _exact in the 100k and 1M
+# benchmarks before turning probing on
+default_n_probe = int(os.getenv('PLAYLIST_N_PROBE', 0))
+
 # Initialize the K-Means pipeline
-song_cluster_pipeline = Pipeline([
-    ('scaler', StandardScaler()),
-    ('kmeans', KMeans(n_clusters=8, verbose=2))
-])
+def build_song_cluster_pipeline():
+    return Pipeline([
+        ('scaler', StandardScaler()),
+        ('kmeans', KMeans(n_clusters=8))
+    ])
 
-# Load songs from the database into a Pandas DataFrame
-with app.app_context():
-    songs_query = db.session.query(Song)
-    df = pd.read_sql(str(songs_query.statement), db.engine)
+song_cluster_pipeline = build_song_cluster_pipeline()
+
+# Fitted pipeline + catalog are saved here so workers don't refit on boot
+artifact_dir = os.getenv('ARTIFACT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts'))
+# Workers map the saved matrices read-only and share them through the page cache,
+# ARTIFACT_MMAP=off reads private copies instead
+artifact_mmap = os.getenv('ARTIFACT_MMAP', 'on') != 'off'
+
+def install_song_catalog(catalog, pipeline, scaled=None, clusters=None, version=None, views=None):
+    global song_cluster_pipeline
+
+    song_cluster_pipeline = pipeline
+    artist_id_pool.refresh()
+    if len(catalog) == 0:
+        return feature_store.load(catalog, version=version, views=views)
+
+    # Scale the resident rows once with the fitted scaler so requests never re-read the table
+    return feature_store.load(catalog, scaler=pipeline.named_steps['scaler'], scaled_columns=features,
+                              clusters=clusters, scaled=scaled, version=version,
+                              views=views)
+
+def build_song_catalog():
+    # Deltas saved up to now are stored in the table, so the new catalog covers them
+    delta_seq = last_delta_seq(artifact_dir)
+    # Stream only the columns the recommenders use, in compact dtypes
+    with app.app_context():
+        frame, matrix, artists = read_song_catalog(db.engine, Song.__table__, feature_store.columns,
+                                                   chunksize=int(os.getenv('CATALOG_CHUNK_SIZE', 50000)))
+
+    # Fit a fresh pipeline so in-flight requests keep using the previous one
+    pipeline = build_song_cluster_pipeline()
+    catalog = FeatureSnapshot.from_frame(frame, feature_store.columns, matrix, artists)
+    if len(catalog) == 0:
+        return install_song_catalog(catalog, pipeline)
+
+    pipeline.fit(matrix[:, [feature_store.columns.index(c) for c in features]])
+    catalog = install_song_catalog(catalog, pipeline)
+    version = save_artifacts(artifact_dir, catalog, pipeline, views=[profile_features], delta_seq=delta_seq)
+    feature_store.version = version
+    reset_catalog_deltas(delta_seq)
+    apply_catalog_deltas()
+    return feature_store.snapshot()
+
+def load_song_catalog():
+    # Prefer the saved artifacts, only read the table and fit when none were built yet
+    # or the saved ones can't be loaded (older format, missing files)
+    try:
+        artifacts = load_artifacts(artifact_dir, mmap=artifact_mmap)
+    except Exception:
+        log.exception("Failed to load the saved catalog, rebuilding it")
+        artifacts = None
+    if artifacts is None:
+        return build_song_catalog()
+    return install_saved_catalog(artifacts)
+
+def install_saved_catalog(artifacts):
+    install_song_catalog(artifacts['catalog'], artifacts['pipeline'], scaled=artifacts['scaled'],
+                         clusters=artifacts['clusters'], version=artifacts['version'], views=artifacts['views'])
+    reset_catalog_deltas(artifacts['delta_seq'])
+    apply_catalog_deltas()
+    return feature_store.snapshot()
+
+# Tracks ingested by any worker are saved to the shared delta log, the others pick them
+# up every CATALOG_DELTA_POLL seconds (0 turns polling off). The same poll installs a new
+# artifact version once CURRENT points at it, e.g. after `flask build-artifacts`, which is
+# how running workers are refreshed. applied_delta_seq is the last
+# delta in the installed catalog; appending is idempotent, so applying one twice is harmless
+catalog_delta_poll = float(os.getenv('CATALOG_DELTA_POLL', 30))
+applied_delta_seq = 0
+applied_deltas_lock = threading.Lock()
+
+def reset_catalog_deltas(delta_seq):
+    # A freshly installed catalog covers the deltas up to delta_seq
+    global applied_delta_seq
+    with applied_deltas_lock:
+        applied_delta_seq = delta_seq
+
+def apply_catalog_deltas():
+    global applied_delta_seq
+    if not feature_store.loaded:
+        return 0
+    with applied_deltas_lock:
+        deltas = load_deltas(artifact_dir, applied_delta_seq)
+        for seq, frame in deltas:
+            feature_store.append(frame)
+            applied_delta_seq = seq
+    for _, frame in deltas:
+        # Another worker stored these tracks, their artists may be new too
+        if 'artists' in frame:
+            add_artists(format_artists(frame.to_dict('records')))
+        else:
+            artist_id_pool.refresh()
+    return len(deltas)
+
+def refresh_song_catalog():
+    # Install the version CURRENT points at if it isn't the one being served, then catch
+    # up on deltas. A version that can't be loaded is left for the next poll, the served
+    # catalog stays in place
+    version = current_version(artifact_dir)
+    if version is not None and version != feature_store.version:
+        artifacts = load_artifacts(artifact_dir, mmap=artifact_mmap)
+        if artifacts is not None:
+            log.info("installing catalog version", extra={"version": artifacts['version']})
+            install_saved_catalog(artifacts)
+            return
+    apply_catalog_deltas()
+
+def poll_catalog_deltas():
+    while True:
+        time.sleep(catalog_delta_poll)
+        try:
+            refresh_song_catalog()
+        except Exception:
+            log.exception("Failed to refresh the song catalog")
+
+def warm_start():
+    try:
+        load_song_catalog()
+        # Start building the search indexes too
+        song_search.get(feature_store.snapshot())
+        with app.app_context():
+            artist_search.get(artist_id_pool.ids())
+    except Exception:
+        log.exception("Failed to load the song catalog")
+    if catalog_delta_poll > 0:
+        threading.Thread(target=poll_catalog_deltas, name='catalog-deltas', daemon=True).start()
+
+# Load in the background so the worker can boot (and answer other endpoints) right away,
+# set CATALOG_WARM_START=off to skip it, e.g. for CLI commands
+if os.getenv('CATALOG_WARM_START', 'background') != 'off':
+    threading.Thread(target=warm_start, name='catalog-warm-start', daemon=True).start()
+
+def add_tracks_to_catalog(tracks):
+    # Newly ingested tracks join the in-memory catalog without a reload or refit,
+    # and are saved for the other workers
+    if not tracks:
+        return
+    global applied_delta_seq
+    frame = pd.DataFrame(tracks)
+    feature_store.append(frame)
+    try:
+        with applied_deltas_lock:
+            seq = save_delta(artifact_dir, frame)
+            # Skip reading it back unless another worker's delta is still to be applied first
+            if seq == applied_delta_seq + 1:
+                applied_delta_seq = seq
+    except OSError:
+        log.exception("Failed to save catalog delta")
+
+track_listeners.append(add_tracks_to_catalog)
+
+@app.cli.command('build-artifacts')
+def build_artifacts():
+    catalog = build_song_catalog()
+    print(f"Built catalog {feature_store.version} with {len(catalog)} songs in {artifact_dir}")
+
+@app.errorhandler(CatalogNotReady)
+def catalog_not_ready(e):
+    return jsonify({"error": str(e)}), 503
+
+def find_artist_songs(artist_id, dataset, catalog=None):
+    # Use the catalog's artist index when available instead of scanning every row
+    if catalog is not None and catalog.artists is not None:
+        return dataset.iloc[catalog.artists.rows_for(artist_id)]
 
+    # Match the artist_id exactly
+    return dataset[dataset['artist_ids'].apply(lambda ids: artist_id in ids if ids else False)]
 
-# Fit the pipeline to the dataset
-if not df.empty:
-    X = df[features]
-    song_cluster_pipeline.fit(X)
+def input_preprocessor_by_artist(artist_id, dataset, features, catalog=None):
+    if catalog is not None and catalog.artists is not None:
+        artist_rows = catalog.artists.rows_for(artist_id)
+        if len(artist_rows) == 0:
+            log.debug("no songs found for artist", extra={"artist_id": artist_id})
+            return None
 
-def input_preprocessor_by_artist(artist_id, dataset, features):
-    # Match the artist_id exactly
-    artist_songs = dataset[dataset['artist_ids'].apply(lambda ids: artist_id in ids if ids else False)]
+        # Average only this artist's rows of the resident feature matrix
+        return catalog.view(features)[artist_rows].mean(axis=0)  # 1D vector
+
+    artist_songs = find_artist_songs(artist_id, dataset)
 
     if artist_songs.empty:
-        print(f"No songs found for artist ID: {artist_id}")
+        log.debug("no songs found for artist", extra={"artist_id": artist_id})
         return None
 
     song_vectors = artist_songs[features].values
     return np.mean(song_vectors, axis=0)  # 1D vector
 
-def music_recommender_by_artist(liked_artists, disliked_artists, dataset, song_cluster_pipeline, features, metadata_cols, n_songs=30):
+def take_unique_names(order, n, name_codes, seen_names):
+    # The first n rows of order whose name isn't in seen_names (a boolean mask over name
+    # codes) or already taken by an earlier row of order. Marks their names as seen
+    order = order[~seen_names[name_codes[order]]]
+    _, first = np.unique(name_codes[order], return_index=True)
+    taken = order[np.sort(first)[:n]]
+    seen_names[name_codes[taken]] = True
+    return taken
+
+def nearest_unique_rows(rows, distances, n, excluded, name_codes, seen_names):
+    # The n rows with the smallest distances whose names aren't in seen_names, marking
+    # those names as seen. rows are the row positions distances belong to (None: every
+    # row), excluded masks the rows that must be skipped. Only the top slice is ranked and
+    # deduplicated; it grows only when repeated names eat into it
+    candidate_codes = name_codes if rows is None else name_codes[rows]
+    # Rows whose name is taken can never be picked, leave them out of the top-k
+    excluded = excluded | seen_names[candidate_codes]
+    available = len(excluded) - int(np.count_nonzero(excluded))
+
+    k = min(available, 4 * n)
+    while True:
+        top = top_k(-distances, k, exclude=excluded)
+        if rows is not None:
+            top = rows[top]
+        taken = take_unique_names(top, n, name_codes, seen_names.copy())
+        if len(taken) == n or k >= available:
+            break
+        k = min(available, 4 * k)
+    seen_names[name_codes[taken]] = True
+    return taken
+
+def nearest_unique_songs(scaled_center, scaled_data, n, excluded, name_codes, seen_names, clusters=None, n_probe=0):
+    # Row positions of the n songs nearest to scaled_center, skipping excluded rows and
+    # repeated names. With n_probe > 0 the rows of the closest clusters are tried first;
+    # the exact search over the rest only runs if they don't fill the n slots
+    picked = []
+    excluded = excluded.copy()
+    if clusters is not None and 0 < n_probe < clusters.n_clusters:
+        with stage('cluster_probe'):
+            probed, distances = clusters.search(scaled_center[0], n_probe)
+            taken = nearest_unique_rows(probed, distances, n, excluded[probed], name_codes, seen_names)
+        picked.append(taken)
+        n -= len(taken)
+        excluded[probed] = True
+
+    if n > 0:
+        with stage('distance'):
+            distances = scaled_data.apply(lambda rows: euclidean_distances(scaled_center, rows)[0])
+            taken = nearest_unique_rows(None, distances, n, excluded, name_codes, seen_names)
+        picked.append(taken)
+
+    return np.concatenate(picked) if picked else np.empty(0, dtype=np.intp)
+
+def music_recommender_by_artist(liked_artists, disliked_artists, dataset, song_cluster_pipeline, features, metadata_cols, n_songs=30, catalog=None, n_probe=0):
     # Shuffle the liked artists to ensure randomness
     random.shuffle(liked_artists)
 
@@ -584,32 +933,47 @@ def music_recommender_by_artist(liked_artists, disliked_artists, dataset, song_c
     liked_artist_quota = n_songs // 2
     per_artist_quota = max(1, liked_artist_quota // len(liked_artists))  # Divide quota among liked artists
 
-    # Collect unique songs only
-    seen_names = set()
-    unique_recs = []
+    # Everything below works on row positions: the artist index gives each artist's rows,
+    # names are compared through their integer codes (-1, a missing name, gets its own)
+    if catalog is not None and catalog.artists is not None:
+        artists = catalog.artists
+    else:
+        artists = ArtistIndex(dataset['artist_ids'].tolist())
+    if catalog is not None:
+        name_codes = np.asarray(catalog.name_codes, dtype=np.intp)
+        n_names = len(catalog.names)
+    elif isinstance(dataset['name'].dtype, pd.CategoricalDtype):
+        name_codes = dataset['name'].cat.codes.to_numpy().astype(np.intp)
+        n_names = len(dataset['name'].cat.categories)
+    else:
+        name_codes, uniques = pd.factorize(dataset['name'])
+        n_names = len(uniques)
+    name_codes = np.where(name_codes < 0, n_names, name_codes)
+    seen_names = np.zeros(n_names + 1, dtype=bool)
 
     # Step 1: Collect songs from all liked artists
-    for artist_id in liked_artists:
-        artist_songs = dataset[dataset['artist_ids'].apply(lambda ids: artist_id in ids if ids else False)]
-        if not artist_songs.empty:
-            # Randomly select songs from the liked artist's songs
-            liked_artist_songs = artist_songs.sample(min(len(artist_songs), per_artist_quota))
-            for _, song in liked_artist_songs.iterrows():
-                if song['name'] not in seen_names:
-                    unique_recs.append(song)
-                    seen_names.add(song['name'])
-                if len(unique_recs) == liked_artist_quota:
-                    break
-        if len(unique_recs) == liked_artist_quota:
-            break
+    picked = []
+    n_picked = 0
+    with stage('artist_songs'):
+        for artist_id in liked_artists:
+            artist_rows = artists.rows_for(artist_id)
+            if len(artist_rows):
+                # Randomly select songs from the liked artist's songs (same draw as DataFrame.sample)
+                sampled = artist_rows[np.random.choice(len(artist_rows), min(len(artist_rows), per_artist_quota), replace=False)]
+                taken = take_unique_names(sampled, liked_artist_quota - n_picked, name_codes, seen_names)
+                picked.append(taken)
+                n_picked += len(taken)
+            if n_picked == liked_artist_quota:
+                break
 
     # Step 2: Fill remaining slots with similar songs
     # Get song center vector for all liked artists
-    song_centers = []
-    for artist_id in liked_artists:
-        song_center = input_preprocessor_by_artist(artist_id, dataset, features)
-        if song_center is not None:
-            song_centers.append(song_center)
+    with stage('artist_centers'):
+        song_centers = []
+        for artist_id in liked_artists:
+            song_center = input_preprocessor_by_artist(artist_id, dataset, features, catalog)
+            if song_center is not None:
+                song_centers.append(song_center)
 
     if not song_centers:
         return pd.DataFrame()
@@ -617,72 +981,148 @@ def music_recommender_by_artist(liked_artists, disliked_artists, dataset, song_c
     # Compute the average center for all liked artists
     avg_song_center = np.mean(song_centers, axis=0)
 
-    # Scale full dataset + the average artist vector
-    scaler = song_cluster_pipeline.steps[0][1]
-    scaled_data = scaler.transform(dataset[features])
-    scaled_center = scaler.transform(avg_song_center.reshape(1, -1))
-
-    # Compute distances
-    distances = euclidean_distances(scaled_center, scaled_data)
-    sorted_indices = np.argsort(distances[0])
-
-    # Fill remaining slots with the best-fit similar songs
-    for idx in sorted_indices:
-        if len(unique_recs) == n_songs:
-            break
-        song = dataset.iloc[idx]
-        name = song['name']
-        # Filter out songs with disliked artists
-        if name not in seen_names and not any(disliked_id in song['artist_ids'] for disliked_id in disliked_artists):
-            unique_recs.append(song)
-            seen_names.add(name)
+    # Scale full dataset + the average artist vector, reusing the catalog's pre-scaled matrix
+    with stage('scaling'):
+        clusters = None
+        if catalog is not None and catalog.scaled is not None and catalog.scaled_columns == list(features):
+            scaler = catalog.scaler
+            scaled_data = catalog.scaled
+            clusters = catalog.clusters
+        else:
+            scaler = song_cluster_pipeline.steps[0][1]
+            scaled_data = AppendableRows(scaler.transform(np.asarray(catalog.view(features)) if catalog is not None
+                                                          else dataset[features]))
+        scaled_center = scaler.transform(avg_song_center.reshape(1, -1))
+
+    # Songs by disliked artists as one boolean mask
+    with stage('artist_filter'):
+        excluded = np.zeros(len(catalog) if catalog is not None else len(dataset), dtype=bool)
+        excluded[artists.rows_for_many(disliked_artists)] = True
+
+    # Fill remaining slots with the best-fit similar songs, probing the nearest clusters first when n_probe is set
+    with stage('fill'):
+        picked.append(nearest_unique_songs(scaled_center, scaled_data, n_songs - n_picked, excluded,
+                                           name_codes, seen_names, clusters, n_probe))
+        rows = np.concatenate(picked)
+
+    # One take for the whole playlist
+    if catalog is not None:
+        recs_df = catalog.songs_frame(rows)
+    else:
+        recs_df = dataset.iloc[rows][[c for c in metadata_cols + ['artist_ids', 'id'] if c in dataset]]
 
-     # Convert list of Series back to DataFrame
-    recs_df = pd.DataFrame(unique_recs)
+    # The compact catalog keeps artist lists in the artist index, not in the frame
+    if 'artist_ids' not in recs_df:
+        recs_df.insert(len(metadata_cols), 'artist_ids', [artists.artist_ids_of(row) for row in rows])
 
     return recs_df[metadata_cols + ['artist_ids', 'id']]
 
 # ----------------------------------------------------------
 
-@app.route('/generate-playlist', methods=['POST'])
-def generate_playlist():
-    global df, song_cluster_pipeline
-
-    # Get the list of liked artist IDs from the request
-    data = request.get_json()
+def playlist_for(data):
+    # Body of /generate-playlist, shared with its background job. Returns (result, status)
     liked_artists = data.get('liked_artists')
     disliked_artists = data.get('disliked_artists', [])
+    n_probe = data.get('n_probe', default_n_probe)
 
     if not liked_artists:
         return {"error": "No liked artists provided"}, 400
+    if not isinstance(n_probe, int) or n_probe < 0:
+        return {"error": "n_probe must be a non-negative integer"}, 400
 
-    print("Liked Artists:", liked_artists)
+    log.debug("generating playlist", extra={"liked_artists": liked_artists, "n_probe": n_probe})
 
     # Generate recommendations for all liked artists
+    catalog = feature_store.snapshot()
     recommendations = music_recommender_by_artist(
         liked_artists=liked_artists,
         disliked_artists=disliked_artists,
-        dataset=df,
+        dataset=None,
         song_cluster_pipeline=song_cluster_pipeline,
         features=features,
         metadata_cols=metadata_cols,
-        n_songs=30  # Adjust the number of songs per playlist
+        n_songs=30,  # Adjust the number of songs per playlist
+        catalog=catalog,
+        n_probe=n_probe
     )
 
     if recommendations.empty:
         return {"error": "No recommendations could be generated"}, 400
 
-    # Convert the recommendations to a list of dictionaries
-    playlist = recommendations.to_dict(orient='records')
-
     # Store only the song IDs in a separate variable
     song_ids = recommendations['id'].tolist()
 
     # Shuffle the song IDs
     random.shuffle(song_ids)
 
-    print("Generated Playlist:", playlist)
-    return jsonify(song_ids), 200
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("generated playlist", extra={"playlist": recommendations.to_dict(orient='records')})
+    return song_ids, 200
+
+@app.route('/generate-playlist', methods=['POST'])
+def generate_playlist():
+    # Get the list of liked artist IDs from the request
+    result, status = playlist_for(request.get_json())
+    return jsonify(result), status
+
+def run_job(fn, args):
+    with app.app_context():
+        return fn(*args)
+
+def job_error_status(e):
+    return 503 if isinstance(e, CatalogNotReady) else 500
+
+# Background pool for the slow endpoints. Submitting answers at once with a job id,
+# a full queue is answered with 429 instead of tying up request threads
+job_runner = JobRunner(run_job, job_error_status,
+                       max_workers=int(os.getenv('JOB_WORKERS', 4)),
+                       max_queued=int(os.getenv('JOB_QUEUE_SIZE', 64)),
+                       result_ttl=int(os.getenv('JOB_RESULT_TTL', 300)),
+                       redis_client=redis_client_from_env())
+registry.gauge('tuneswipe_jobs', 'Background jobs queued and running', job_runner.depth, ['state'])
+
+# Longest a GET /jobs/<id>?wait= long-poll is held open
+job_max_wait = float(os.getenv('JOB_MAX_WAIT', 30))
+
+job_kinds = {
+    'generate-playlist': playlist_for,
+    'random-artists': random_artists_for,
+}
+
+@app.route('/jobs/<string:kind>', methods=['POST'])
+def submit_job(kind):
+    fn = job_kinds.get(kind)
+    if fn is None:
+        return {"error": f"Unknown job kind: {kind}"}, 404
+    data = request.get_json() or {}
+    try:
+        job = job_runner.submit(kind, fn, data)
+    except JobQueueFull:
+        response = jsonify({"error": "Too many jobs queued, try again shortly"})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+
+    response = jsonify({"job_id": job.id, "state": job.state, "status_url": f"/jobs/{job.id}"})
+    response.headers['Location'] = f"/jobs/{job.id}"
+    return response, 202
+
+@app.route('/jobs/<string:job_id>', methods=['GET'])
+def get_job(job_id):
+    # ?wait=<seconds> long-polls until the job finishes (capped at JOB_MAX_WAIT)
+    try:
+        wait = min(float(request.args.get('wait', 0)), job_max_wait)
+    except ValueError:
+        return {"error": "wait must be a number of seconds"}, 400
+
+    job = job_runner.status(job_id, wait)
+    if job is None:
+        return {"error": "Job not found or expired"}, 404
+    return jsonify(job), 200 if Job.is_finished(job) else 202
+
+@app.cli.command('create-indexes')
+def create_indexes():
+    count = ensure_indexes(db.engine)
+    print(f"Ensured {count} indexes")
 
 if __name__ == "__main__":
    app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,108 @@
+import numpy as np
+
+class _Tail:
+    # Side buffer shared by successive AppendableRows, rows[:filled] are written
+    def __init__(self, rows, filled):
+        self.rows = rows
+        self.filled = filled
+
+class AppendableRows:
+    # Rows of a read-only base array (e.g. memory-mapped from the artifacts) followed by
+    # the rows appended since, kept in a side buffer whose capacity doubles. append()
+    # returns a new instance and only writes past the rows this one covers, so it costs
+    # O(new rows) and earlier instances keep reading the same data. Base and appended
+    # rows are only merged into one array by a full rebuild
+    def __init__(self, base, tail=None, size=0):
+        self.base = base
+        self._tail = tail
+        # Rows of the side buffer this instance covers
+        self._size = size
+
+    @property
+    def tail(self):
+        if self._tail is None:
+            return self.base[:0]
+        return self._tail.rows[:self._size]
+
+    @property
+    def dtype(self):
+        if self._tail is None:
+            return self.base.dtype
+        return np.promote_types(self.base.dtype, self._tail.rows.dtype)
+
+    @property
+    def itemsize(self):
+        return self.dtype.itemsize
+
+    @property
+    def ndim(self):
+        return self.base.ndim
+
+    @property
+    def shape(self):
+        return (len(self),) + self.base.shape[1:]
+
+    def __len__(self):
+        return len(self.base) + self._size
+
+    def segments(self):
+        return [self.base, self.tail] if self._size else [self.base]
+
+    def append(self, rows):
+        rows = np.asarray(rows)
+        # Ids longer than the base's fixed width widen the side buffer instead of being cut
+        dtype = np.promote_types(self.dtype, rows.dtype) if rows.dtype.kind == 'U' else self.dtype
+        size = self._size + len(rows)
+        tail = self._tail
+        if tail is None or tail.filled != self._size or size > len(tail.rows) or tail.rows.dtype != dtype:
+            # First append, a branch off an older instance, or out of room
+            buffer = np.empty((max(2 * size, 16),) + self.base.shape[1:], dtype=dtype)
+            buffer[:self._size] = self.tail
+            tail = _Tail(buffer, self._size)
+        tail.rows[tail.filled:size] = rows
+        tail.filled = size
+        return AppendableRows(self.base, tail, size)
+
+    def apply(self, function):
+        # function over each segment, results concatenated along the rows, e.g. the
+        # distances from a query to every row without merging the segments first
+        parts = [function(segment) for segment in self.segments()]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def __matmul__(self, other):
+        return self.apply(lambda segment: segment @ other)
+
+    def __getitem__(self, key):
+        if not self._size:
+            return self.base[key]
+        rows, rest = (key[0], key[1:]) if isinstance(key, tuple) else (key, ())
+        if isinstance(rows, slice):
+            rows = np.arange(len(self))[rows]
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        scalar = rows.ndim == 0
+        rows = np.atleast_1d(rows).astype(np.intp)
+        rows = np.where(rows < 0, rows + len(self), rows)
+
+        n_base = len(self.base)
+        in_base = rows < n_base
+        if in_base.all():
+            taken = self.base[rows]
+        elif not in_base.any():
+            taken = self.tail[rows - n_base]
+        else:
+            taken = np.empty((len(rows),) + self.base.shape[1:], dtype=self.dtype)
+            taken[in_base] = self.base[rows[in_base]]
+            taken[~in_base] = self.tail[rows[~in_base] - n_base]
+        if scalar:
+            return taken[0][rest] if rest else taken[0]
+        return taken[(slice(None),) + rest] if rest else taken
+
+    def __iter__(self):
+        for segment in self.segments():
+            yield from segment
+
+    def __array__(self, dtype=None, copy=None):
+        merged = self.apply(np.asarray)
+        return merged if dtype is None else merged.astype(dtype, copy=False)
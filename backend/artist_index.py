@@ -0,0 +1,117 @@
+import copy
+import numpy as np
+from id_index import IdIndex, id_array
+
+class ArtistIndex:
+    # artist_id -> row positions, stored CSR-style: the rows of artist code c
+    # are rows[offsets[c]:offsets[c + 1]]. The row -> artists direction is kept
+    # the same way: the artist codes of row r are row_codes[row_offsets[r]:row_offsets[r + 1]].
+    # artist_id -> code goes through a sorted IdIndex, so every array here can be memory-mapped
+    def __init__(self, artist_lists):
+        codes = {}
+        flat_codes = []
+        row_counts = np.zeros(len(artist_lists), dtype=np.intp)
+
+        for row, artist_ids in enumerate(artist_lists):
+            if artist_ids is None or isinstance(artist_ids, float):
+                continue  # NULL artist_ids
+            row_codes = [codes.setdefault(a, len(codes)) for a in dict.fromkeys(artist_ids)]
+            flat_codes.extend(row_codes)
+            row_counts[row] = len(row_codes)
+
+        self._build(codes, np.asarray(flat_codes, dtype=np.int32), row_counts)
+
+    @classmethod
+    def from_codes(cls, codes, flat_codes, row_counts):
+        # Build from already encoded rows: codes maps artist_id -> code, flat_codes holds
+        # the codes of every row back to back and row_counts how many belong to each row
+        index = cls.__new__(cls)
+        index._build(codes, np.asarray(flat_codes, dtype=np.int32), np.asarray(row_counts, dtype=np.intp))
+        return index
+
+    def _build(self, codes, flat_codes, row_counts):
+        # codes maps artist_id -> code, in code order
+        self.artist_ids = id_array(codes)
+        self.lookup = IdIndex(self.artist_ids)
+        self.row_codes = flat_codes
+        self.row_offsets = np.zeros(len(row_counts) + 1, dtype=np.intp)
+        np.cumsum(row_counts, out=self.row_offsets[1:])
+
+        # Group the (artist, row) pairs by artist, rows stay ascending inside each group
+        flat_rows = np.repeat(np.arange(len(row_counts), dtype=np.int32), row_counts)
+        order = np.argsort(flat_codes, kind='stable')
+        self.rows = flat_rows[order]
+        self.offsets = np.zeros(len(codes) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(flat_codes, minlength=len(codes)), out=self.offsets[1:])
+
+        # Rows appended after the CSR arrays were built, see extended(). Both dicts are
+        # shared with the indexes extended from this one, each only trusts rows below size
+        self.extra = {}
+        self.extra_rows = {}
+        self.size = len(row_counts)
+
+    def _extra_rows_for(self, artist_id):
+        rows = self.extra.get(artist_id)
+        if rows is None or rows[-1] < self.size:
+            return rows
+        rows = rows[:np.searchsorted(rows, self.size)]
+        return rows if len(rows) else None
+
+    def __contains__(self, artist_id):
+        return artist_id in self.lookup or self._extra_rows_for(artist_id) is not None
+
+    def rows_for(self, artist_id, code=None):
+        if code is None:
+            code = self.lookup.lookup([artist_id])[0]
+        if code < 0:
+            rows = self.rows[:0]
+        else:
+            rows = self.rows[self.offsets[code]:self.offsets[code + 1]]
+        extra = self._extra_rows_for(artist_id)
+        if extra is not None:
+            rows = np.concatenate([rows, extra])
+        return rows
+
+    def artist_ids_of(self, row):
+        # The artist_ids list of one row
+        if row in self.extra_rows:
+            return self.extra_rows[row]
+        if row + 1 >= len(self.row_offsets):
+            return []
+        return self.artist_ids[self.row_codes[self.row_offsets[row]:self.row_offsets[row + 1]]].tolist()
+
+    def extended(self, artist_lists):
+        # New index that also covers the rows after this one's without rebuilding the
+        # CSR arrays, which are shared with this (unchanged) index
+        index = copy.copy(self)
+        if len(self.extra_rows) != self.size - (len(self.row_offsets) - 1):
+            # Another index was already extended from this one, keep only our own rows
+            index.extra_rows = {row: ids for row, ids in self.extra_rows.items() if row < self.size}
+            index.extra = {}
+            for artist_id in self.extra:
+                rows = self._extra_rows_for(artist_id)
+                if rows is not None:
+                    index.extra[artist_id] = rows
+        index.size = self.size + len(artist_lists)
+        added = {}
+        for row, artist_ids in enumerate(artist_lists, start=self.size):
+            if artist_ids is None or isinstance(artist_ids, float):
+                index.extra_rows[row] = []
+                continue
+            artist_ids = list(dict.fromkeys(artist_ids))
+            index.extra_rows[row] = artist_ids
+            for artist_id in artist_ids:
+                added.setdefault(artist_id, []).append(row)
+        for artist_id, rows in added.items():
+            previous = index.extra.get(artist_id)
+            rows = np.asarray(rows, dtype=np.int32)
+            index.extra[artist_id] = rows if previous is None else np.concatenate([previous, rows])
+        return index
+
+    def rows_for_many(self, artist_ids):
+        # Union of the rows of several artists, sorted and without duplicates
+        artist_ids = list(artist_ids)
+        parts = [self.rows_for(a, code) for a, code in zip(artist_ids, self.lookup.lookup(artist_ids))]
+        if not parts:
+            return self.rows[:0]
+        return np.unique(np.concatenate(parts))
@@ -0,0 +1,233 @@
+# Times the recommender paths against a synthetic catalog in a local Postgres database.
+#
+#   cd backend
+#   python -m benchmarks.run --database-url postgresql://localhost/tuneswipe_bench --size 10k \
+#       --output bench-10k.json --baseline benchmarks/baselines/10k.json
+#
+# The database is seeded on first use (it must be empty or already hold the same synthetic
+# catalog, --reseed wipes it). Results are JSON with p50/p95/mean latency per benchmark and
+# the process peak RSS after it. With --baseline the run fails when a p95 is more than
+# --tolerance times the baseline's, --save-baseline writes the results as the new baseline.
+# benchmarks/baselines/10k.json was recorded on a single x86_64 machine; timings depend on
+# the hardware, so save a baseline on the machine that runs the comparison.
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import text
+from benchmarks.synthetic import WORDS, parse_size, synthetic_catalog
+
+# Clusters probed by the music_recommender_by_artist_ivf benchmark
+IVF_BENCHMARK_PROBES = 8
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def summarize(samples_ms):
+    samples_ms = np.asarray(samples_ms)
+    return {
+        'runs': len(samples_ms),
+        'p50_ms': round(float(np.percentile(samples_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples_ms, 95)), 3),
+        'mean_ms': round(float(samples_ms.mean()), 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def timed(fn, runs, warmup=1):
+    # fn(i) is called warmup + runs times, app prints are silenced while it runs
+    samples = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            fn(i)
+            if i >= warmup:
+                samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+def check(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+def seed_database(app_module, n_songs, seed, reseed):
+    from spotify_utils import store_tracks
+    db, Song = app_module.db, app_module.Song
+    with app_module.app.app_context():
+        db.create_all()
+        count = db.session.query(Song).count()
+        if reseed and count:
+            db.session.execute(text('TRUNCATE songs, artists'))
+            db.session.commit()
+            count = 0
+        if count == n_songs:
+            return False
+        if count:
+            raise SystemExit(f"songs holds {count} rows, not the {n_songs} synthetic ones; use --reseed on a benchmark database")
+
+        for songs, artists in synthetic_catalog(n_songs, seed):
+            store_tracks(songs, artists, batch_size=5000)
+        app_module.ensure_indexes(db.engine)
+    return True
+
+def wait_for(get, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = get()
+        if value is not None:
+            return value
+        time.sleep(0.1)
+    raise RuntimeError("timed out waiting for a search index")
+
+def run_benchmarks(app_module, runs, startup_runs, seed):
+    A = app_module
+    client = A.app.test_client()
+    rng = np.random.default_rng(seed)
+    results = {}
+
+    with A.app.app_context():
+        results['startup_fit'] = timed(lambda i: A.build_song_catalog(), startup_runs, warmup=0)
+        results['startup_load'] = timed(lambda i: A.load_song_catalog(), startup_runs, warmup=0)
+
+        catalog = A.feature_store.snapshot()
+        song_ids = catalog.ids
+        artist_ids = catalog.artists.artist_ids
+        artist_names = [name for (name,) in A.db.session.query(A.Artist.artist_name).limit(5000)]
+
+    def swipes(n):
+        picked = rng.choice(len(song_ids), n, replace=False)
+        return [{'id': song_ids[row], 'liked': bool(rng.random() < 0.5)} for row in picked]
+
+    payloads = [swipes(20) for _ in range(runs + 1)]
+    results['create_playlist'] = timed(
+        lambda i: check(client.post('/create-playlist', json={'activityLog': {'swipeResults': payloads[i]}})), runs)
+
+    def artist_payload(n_probe=None):
+        picked = rng.choice(len(artist_ids), 5, replace=False)
+        payload = {'liked_artists': artist_ids[picked[:3]].tolist(), 'disliked_artists': artist_ids[picked[3:]].tolist()}
+        if n_probe is not None:
+            payload['n_probe'] = n_probe
+        return payload
+
+    payloads = [artist_payload() for _ in range(runs + 1)]
+    results['music_recommender_by_artist'] = timed(
+        lambda i: check(client.post('/generate-playlist', json=payloads[i])), runs)
+    payloads = [artist_payload(0) for _ in range(runs + 1)]
+    results['music_recommender_by_artist_exact'] = timed(
+        lambda i: check(client.post('/generate-playlist', json=payloads[i])), runs)
+    # Probing the nearest clusters first, to compare against the exact search above
+    payloads = [artist_payload(IVF_BENCHMARK_PROBES) for _ in range(runs + 1)]
+    results['music_recommender_by_artist_ivf'] = timed(
+        lambda i: check(client.post('/generate-playlist', json=payloads[i])), runs)
+
+    # A handful of users, each request brings a few new swipes
+    payloads = [{'activityLog': {'user_id': f'bench-user-{i % 8}', 'swipeResults': swipes(5)}} for i in range(runs + 1)]
+    results['logregression'] = timed(lambda i: check(client.post('/logregression', json=payloads[i])), runs)
+
+    def similar_artists():
+        seeds = rng.choice(len(artist_names), 5, replace=False)
+        return {artist_names[s]: [artist_names[a] for a in rng.choice(len(artist_names), 10, replace=False)]
+                for s in seeds}
+
+    payloads = [(similar_artists(), artist_ids[rng.choice(len(artist_ids), 3)].tolist()) for _ in range(runs + 1)]
+    with A.app.app_context():
+        results['check_songs'] = timed(lambda i: A.check_songs(*payloads[i]), runs)
+
+    # Searches through the in-process indexes, once they're built
+    with A.app.app_context():
+        wait_for(lambda: A.song_search.get(A.feature_store.snapshot()))
+        wait_for(lambda: A.artist_search.get(A.artist_id_pool.ids()))
+    queries = []
+    for _ in range(runs + 1):
+        word = WORDS[rng.integers(len(WORDS))]
+        queries.append(rng.choice([word[:3], word, f"{word} {WORDS[rng.integers(len(WORDS))]}", word[1:] + word[0]]))
+    for name, path in [('song_search', '/song-search'), ('artist_search', '/artist-search')]:
+        results[name] = timed(lambda i: check(client.get(path, query_string={'query': queries[i]})), runs)
+        results[name + '_prefix'] = timed(
+            lambda i: check(client.get(path, query_string={'query': queries[i][:3], 'prefix': 1})), runs)
+
+    return results
+
+def compare(results, baseline, tolerance):
+    # Benchmarks whose p95 got more than tolerance times slower than in the baseline
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base and result['p95_ms'] > base['p95_ms'] * tolerance:
+            regressions.append({'benchmark': name, 'p95_ms': result['p95_ms'], 'baseline_p95_ms': base['p95_ms'],
+                                'ratio': round(result['p95_ms'] / base['p95_ms'], 2)})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the recommender paths on a synthetic catalog')
+    parser.add_argument('--database-url', default=os.getenv('BENCHMARK_DATABASE_URL'),
+                        help='Postgres database to seed and run against (BENCHMARK_DATABASE_URL)')
+    parser.add_argument('--size', default='10k', help="10k, 100k, 1m or a number of songs")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--startup-runs', type=int, default=3)
+    parser.add_argument('--reseed', action='store_true', help='truncate songs/artists and seed again')
+    parser.add_argument('--output', help='write the results JSON here (default stdout)')
+    parser.add_argument('--baseline', help='baseline results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed p95 ratio against the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to --baseline')
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error('--database-url (or BENCHMARK_DATABASE_URL) is required')
+    if args.baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f'baseline {args.baseline} does not exist, create it with --save-baseline')
+    n_songs = parse_size(args.size)
+
+    # The app reads these at import time
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['CATALOG_WARM_START'] = 'off'
+    os.environ.setdefault('ARTIFACT_DIR', tempfile.mkdtemp(prefix='tuneswipe-bench-'))
+    os.environ.setdefault('SPOTIPY_CLIENT_ID', 'benchmark')
+    os.environ.setdefault('SPOTIPY_CLIENT_SECRET', 'benchmark')
+    import app as app_module
+
+    start = time.perf_counter()
+    seeded = seed_database(app_module, n_songs, args.seed, args.reseed)
+    print(f"{'Seeded' if seeded else 'Reusing'} {n_songs} songs ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+
+    report = {
+        'size': args.size,
+        'songs': n_songs,
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': run_benchmarks(app_module, args.runs, args.startup_runs, args.seed),
+    }
+
+    exit_code = 0
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(report['results'], json.load(f), args.tolerance)
+        exit_code = 1 if report['regressions'] else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.baseline and args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            f.write(output + '\n')
+
+    for regression in report.get('regressions', []):
+        print(f"REGRESSION {regression['benchmark']}: p95 {regression['p95_ms']}ms vs "
+              f"{regression['baseline_p95_ms']}ms ({regression['ratio']}x)", file=sys.stderr)
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import numpy as np
+
+# Catalog sizes the benchmarks run at
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Song and artist names are built from these, so searches hit realistic shared words
+WORDS = ['love', 'night', 'heart', 'summer', 'fire', 'dream', 'light', 'rain', 'blue', 'gold',
+         'wild', 'river', 'ghost', 'city', 'moon', 'star', 'dance', 'storm', 'shadow', 'paper',
+         'sugar', 'neon', 'echo', 'velvet', 'ocean', 'silver', 'thunder', 'honey', 'midnight', 'road',
+         'glass', 'crystal', 'garden', 'highway', 'radio', 'cherry', 'diamond', 'electric', 'winter', 'golden',
+         'broken', 'young', 'lonely', 'sweet', 'little', 'black', 'crazy', 'happy', 'lost', 'last']
+
+def parse_size(size):
+    # '10k', '100k', '1m' or a plain number of songs
+    size = str(size).lower()
+    if size in SIZES:
+        return SIZES[size]
+    return int(size)
+
+def synthetic_artists(n_artists, rng):
+    # artists rows with unique two-word names
+    artists = []
+    seen = set()
+    for i in range(n_artists):
+        first, second = rng.choice(len(WORDS), 2, replace=False)
+        name = f"{WORDS[first]} {WORDS[second]}".title()
+        if name in seen:
+            name = f"{name} {i}"
+        seen.add(name)
+        artists.append({"artist_id": f"bench-artist-{i}", "artist_name": name})
+    return artists
+
+def synthetic_catalog(n_songs, seed=0, batch_size=10_000):
+    # Deterministic songs/artists for a given (n_songs, seed). Yields (songs, artists) per
+    # batch of songs in the shape format_track produces, artists with the first batch only.
+    # Artist popularity is skewed, so a few artists have many songs like in real data
+    rng = np.random.default_rng(seed)
+    n_artists = max(50, n_songs // 8)
+    artists = synthetic_artists(n_artists, rng)
+    popularity = 1 / np.arange(1, n_artists + 1) ** 0.8
+    popularity /= popularity.sum()
+
+    for start in range(0, n_songs, batch_size):
+        n = min(batch_size, n_songs - start)
+        credits = rng.choice(n_artists, size=(n, 3), p=popularity)
+        credit_counts = rng.choice([1, 2, 3], size=n, p=[0.75, 0.2, 0.05])
+        name_words = rng.integers(0, len(WORDS), size=(n, 3))
+        name_lengths = rng.integers(1, 4, size=n)
+        features = {
+            "danceability": rng.random(n), "energy": rng.random(n), "speechiness": rng.random(n) * 0.5,
+            "acousticness": rng.random(n), "instrumentalness": rng.random(n) ** 3, "liveness": rng.random(n) * 0.6,
+            "valence": rng.random(n), "loudness": rng.uniform(-30, 0, n), "tempo": rng.uniform(60, 200, n),
+        }
+        keys = rng.integers(0, 12, size=n)
+        modes = rng.integers(0, 2, size=n)
+        time_signatures = rng.choice([3.0, 4.0, 5.0], size=n, p=[0.1, 0.85, 0.05])
+        durations = rng.integers(90_000, 420_000, size=n)
+        years = rng.integers(1960, 2025, size=n)
+        explicit = rng.random(n) < 0.15
+
+        songs = []
+        for i in range(n):
+            song_artists = [artists[a] for a in dict.fromkeys(credits[i, :credit_counts[i]].tolist())]
+            songs.append({
+                "id": f"bench-song-{start + i}",
+                "name": ' '.join(WORDS[w] for w in name_words[i, :name_lengths[i]]).title(),
+                "album": f"{WORDS[name_words[i, 0]].title()} Sessions",
+                "artist_ids": [a["artist_id"] for a in song_artists],
+                "artists": [a["artist_name"] for a in song_artists],
+                "track_number": int(i % 12 + 1),
+                "disc_number": 1,
+                "explicit": bool(explicit[i]),
+                "duration_ms": int(durations[i]),
+                "year": int(years[i]),
+                "key": int(keys[i]),
+                "mode": int(modes[i]),
+                "time_signature": float(time_signatures[i]),
+                **{name: float(values[i]) for name, values in features.items()},
+            })
+        yield songs, artists if start == 0 else []
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by cache lookups on a miss, so None can be cached as a value
+MISSING = object()
+
+class LRUCache:
+    # In-process cache with a size bound (least recently used entries go first)
+    # and an optional per-entry TTL in seconds
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class RedisCache:
+    # JSON values in Redis. client is a redis.Redis or anything with the same
+    # get/set(ex=)/delete methods (e.g. an in-memory fake in tests).
+    # Redis errors are treated as misses so the cache never takes a request down.
+    def __init__(self, client, prefix='', ttl=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception:
+            return MISSING
+        if raw is None:
+            return MISSING
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+        except Exception:
+            pass
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception:
+            pass
+
+class TieredCache:
+    # In-process LRU in front of an optional shared (Redis) tier, with hit/miss counters.
+    # Entries read back from the shared tier are kept locally for promote_ttl seconds
+    # (the local default when None), since their remaining remote TTL is unknown
+    def __init__(self, local, remote=None, promote_ttl=None):
+        self.local = local
+        self.remote = remote
+        self.promote_ttl = promote_ttl
+        self._counts = {'local_hits': 0, 'remote_hits': 0, 'misses': 0}
+        self._counts_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._counts_lock:
+            self._counts[name] += 1
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._count('local_hits')
+            return value
+
+        if self.remote is not None:
+            value = self.remote.get(key)
+            if value is not MISSING:
+                self._count('remote_hits')
+                self.local.set(key, value, self.promote_ttl)
+                return value
+
+        self._count('misses')
+        return MISSING
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, ttl)
+        if self.remote is not None:
+            self.remote.set(key, value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.remote is not None:
+            self.remote.delete(key)
+
+    def stats(self):
+        with self._counts_lock:
+            return dict(self._counts, size=len(self.local))
+
+def redis_client_from_env(url=None):
+    # Redis client for REDIS_URL, or None when Redis is not configured
+    url = url or os.getenv('REDIS_URL')
+    if not url:
+        return None
+    import redis
+    return redis.Redis.from_url(url)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from sqlalchemy import select
+from artist_index import ArtistIndex
+
+def compact_frame(ids, names, years):
+    # The per-song metadata the recommenders read, everything numeric lives in the
+    # feature matrix. Names are categorical so repeated titles share one string
+    return pd.DataFrame({
+        'id': pd.Series(ids, dtype=object),
+        'name': names if isinstance(names, pd.Categorical) else pd.Categorical(names),
+        'year': pd.array(years, dtype='Int16'),
+    })
+
+def read_song_catalog(engine, song_table, feature_columns, chunksize=50000):
+    # Stream only the id, name, artist_ids and feature columns of the songs table in
+    # chunks, so the full table never sits in memory as Python objects.
+    # Returns (frame, float32 feature matrix, ArtistIndex)
+    query = select(song_table.c.id, song_table.c.name, song_table.c.artist_ids,
+                   *[song_table.c[c] for c in feature_columns])
+
+    ids = []
+    names = []
+    matrices = []
+    artist_codes = {}
+    flat_codes = []
+    row_counts = []
+
+    with engine.connect().execution_options(stream_results=True) as connection:
+        for chunk in pd.read_sql(query, connection, chunksize=chunksize):
+            ids.extend(chunk['id'].tolist())
+            names.append(pd.Categorical(chunk['name']))
+            matrices.append(chunk[feature_columns].to_numpy(dtype=np.float32, na_value=np.nan))
+
+            # Encode artist lists as int codes right away, the lists themselves are dropped
+            for artist_ids in chunk['artist_ids']:
+                if artist_ids is None or isinstance(artist_ids, float):
+                    row_counts.append(0)
+                    continue
+                row_codes = [artist_codes.setdefault(a, len(artist_codes)) for a in dict.fromkeys(artist_ids)]
+                flat_codes.extend(row_codes)
+                row_counts.append(len(row_codes))
+
+    if matrices:
+        matrix = np.concatenate(matrices)
+        names = union_categoricals(names)
+    else:
+        matrix = np.empty((0, len(feature_columns)), dtype=np.float32)
+        names = pd.Categorical([])
+
+    years = matrix[:, feature_columns.index('year')] if 'year' in feature_columns else np.full(len(ids), np.nan)
+    frame = compact_frame(ids, names, years)
+    artists = ArtistIndex.from_codes(artist_codes, flat_codes, row_counts)
+    return frame, matrix, artists
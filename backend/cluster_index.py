@@ -0,0 +1,84 @@
+import copy
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+class ClusterIndex:
+    # IVF-style index over K-Means clusters of the scaled matrix: the rows of cluster c
+    # are rows[offsets[c]:offsets[c + 1]]. rows, offsets and centers are flat arrays that
+    # are saved with the artifacts, so workers don't refit them
+    def __init__(self, scaled, rows, offsets, centers):
+        self.scaled = scaled
+        self.rows = rows
+        self.offsets = offsets
+        self.centers = np.asarray(centers, dtype=np.float64)
+        self.counts = np.diff(offsets)
+        # Rows appended after the index was built, per cluster, see extended()
+        self.extra = {}
+
+    @classmethod
+    def from_labels(cls, scaled, labels, centers):
+        labels = np.asarray(labels, dtype=np.intp)
+        offsets = np.zeros(len(centers) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(labels, minlength=len(centers)), out=offsets[1:])
+        return cls(scaled, np.argsort(labels, kind='stable').astype(np.intp), offsets, centers)
+
+    @classmethod
+    def fit(cls, scaled, n_clusters=None, sample_size=None, chunk_size=100_000, random_state=0):
+        # About sqrt(N) clusters keeps both the centre scan and each probed cluster small
+        # as the catalog grows. The centres are fitted on a sample, every row is then
+        # assigned to its nearest centre chunk by chunk
+        n_rows = len(scaled)
+        if n_clusters is None:
+            n_clusters = max(1, int(np.sqrt(n_rows)))
+        n_clusters = min(n_clusters, n_rows)
+        if sample_size is None:
+            sample_size = max(10_000, 50 * n_clusters)
+        rng = np.random.default_rng(random_state)
+        sample = scaled[np.sort(rng.choice(n_rows, min(n_rows, sample_size), replace=False))]
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, n_init=3, random_state=random_state).fit(sample)
+        labels = np.concatenate([kmeans.predict(scaled[start:start + chunk_size])
+                                 for start in range(0, n_rows, chunk_size)])
+        return cls.from_labels(scaled, labels, kmeans.cluster_centers_)
+
+    @property
+    def n_clusters(self):
+        return len(self.centers)
+
+    def cluster_rows(self, cluster):
+        rows = self.rows[self.offsets[cluster]:self.offsets[cluster + 1]]
+        extra = self.extra.get(cluster)
+        return rows if extra is None else np.concatenate([rows, extra])
+
+    def extended(self, scaled, new_rows):
+        # New index over the grown scaled matrix. Each new row joins its nearest cluster
+        # and moves that centre by a running-mean step (the MiniBatchKMeans update), so
+        # the cost is O(new rows) and this index stays untouched for in-flight readers
+        index = copy.copy(self)
+        index.scaled = scaled
+        index.centers = self.centers.copy()
+        index.counts = self.counts.copy()
+        index.extra = dict(self.extra)
+
+        new_rows = np.asarray(new_rows, dtype=np.intp)
+        points = scaled[new_rows]
+        labels = np.argmin(((points[:, None, :] - index.centers[None, :, :]) ** 2).sum(axis=2), axis=1)
+        for cluster in np.unique(labels):
+            members = labels == cluster
+            count = index.counts[cluster] + members.sum()
+            index.centers[cluster] += (points[members] - index.centers[cluster]).sum(axis=0) / count
+            index.counts[cluster] = count
+            previous = index.extra.get(cluster)
+            rows = new_rows[members]
+            index.extra[cluster] = rows if previous is None else np.concatenate([previous, rows])
+        return index
+
+    def nearest_clusters(self, query, n_probe):
+        center_distances = np.linalg.norm(self.centers - query, axis=1)
+        return np.argpartition(center_distances, n_probe - 1)[:n_probe]
+
+    def search(self, query, n_probe):
+        # Rows of the n_probe clusters closest to the query and their distances to it,
+        # unordered: callers rank only the slice they need, see ranking.top_k
+        clusters = self.nearest_clusters(query, n_probe)
+        candidates = np.concatenate([self.cluster_rows(c) for c in clusters])
+        return candidates, np.linalg.norm(self.scaled[candidates] - query, axis=1)
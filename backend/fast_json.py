@@ -0,0 +1,48 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional, the stdlib encoder is used without it
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    # jsonify/app.json through orjson when it's installed, with the same output as the
+    # default provider: compact, sorted keys, dates etc. through DefaultJSONProvider.default.
+    # Pretty-printed (debug) output and anything orjson rejects use the stdlib path
+    if orjson is not None:
+        option = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                  | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+
+    def dumps_bytes(self, obj):
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self.option)
+            except TypeError:
+                pass
+        return super().dumps(obj, separators=(',', ':')).encode()
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or 'indent' in kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+def iter_json_list(items, dumps):
+    # A JSON array in pieces, for streaming large lists instead of building one body.
+    # items may be dicts (encoded with dumps) or already encoded JSON strings
+    yield '['
+    for i, item in enumerate(items):
+        if not isinstance(item, str):
+            item = dumps(item)
+        yield item if i == 0 else ',' + item
+    yield ']'
@@ -0,0 +1,210 @@
+import copy
+import threading
+import numpy as np
+import pandas as pd
+from appendable_rows import AppendableRows
+from artist_index import ArtistIndex
+from cluster_index import ClusterIndex
+from id_index import IdIndex, id_array
+from name_table import NameTable
+
+# Numeric song columns kept resident for the recommenders
+FEATURE_COLUMNS = ['danceability', 'energy', 'key', 'loudness', 'mode',
+                   'speechiness', 'acousticness', 'instrumentalness',
+                   'liveness', 'valence', 'tempo', 'time_signature',
+                   'year', 'duration_ms', 'explicit']
+
+class FeatureSnapshot:
+    # The resident catalog as flat arrays, row i is song ids[i]: every per-song structure
+    # (ids and their sorted lookup, name codes, the name table, features) can be saved and
+    # memory-mapped, so workers serving the same catalog version share one copy.
+    # Per-row arrays are AppendableRows, so appended songs never copy the loaded ones
+    def __init__(self, ids, names, name_codes, matrix, columns=FEATURE_COLUMNS, artists=None, id_order=None):
+        self.columns = list(columns)
+        self.ids = AppendableRows(ids)
+        self.index = IdIndex(ids, id_order)
+        # Song names as codes into the NameTable, -1 for a missing name
+        self.names = names
+        self.name_codes = AppendableRows(name_codes)
+        # float32 features, row i belongs to song self.ids[i]
+        self.matrix = AppendableRows(np.ascontiguousarray(matrix, dtype=np.float32))
+        # artist_id -> rows, so artist lookups don't scan the whole catalog
+        self.artists = artists
+        # Standardized features, filled in by scale() once the scaler is fitted
+        self.scaler = None
+        self.scaled = None
+        self.scaled_columns = None
+        # Per-cluster row lists over the scaled matrix, see index_clusters()
+        self.clusters = None
+        self._views = {}
+        self._views_lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, frame, columns=FEATURE_COLUMNS, matrix=None, artists=None):
+        # From a frame with id, name (categorical or not) and, unless given, the feature
+        # columns and artist_ids
+        if matrix is None:
+            matrix = frame[list(columns)].to_numpy(dtype=np.float32, na_value=np.nan)
+        if artists is None and 'artist_ids' in frame:
+            artists = ArtistIndex(frame['artist_ids'].tolist())
+        names, name_codes = NameTable.from_categorical(pd.Categorical(frame['name']))
+        return cls(id_array(frame['id']), names, name_codes, matrix, columns, artists)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, song_ids):
+        # Row positions of the given ids, unknown ids are skipped
+        return self.index.rows(song_ids)
+
+    def song_names(self, rows):
+        return [self.names[code] if code >= 0 else None for code in self.name_codes[rows].tolist()]
+
+    def songs_frame(self, rows):
+        # id, name and year of the given rows, e.g. to log a playlist
+        years = self.matrix[rows, self.columns.index('year')].astype(np.float64)
+        return pd.DataFrame({
+            'year': pd.array(years).astype('Int16'),
+            'name': self.song_names(rows),
+            'id': self.ids[rows].tolist(),
+        })
+
+    def mask(self, song_ids):
+        # Boolean row mask of the given ids, e.g. songs to exclude from a ranking
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.rows(song_ids)] = True
+        return mask
+
+    def unit_view(self, columns):
+        # Unit-length float32 rows of a column subset, so cosine similarity is a plain dot product
+        return self._cached_view(('unit',) + tuple(columns))
+
+    def scale(self, scaler, columns, scaled=None):
+        # Transform the whole catalog once so requests only scale their query vector,
+        # or adopt a matrix that was already transformed (e.g. loaded from disk)
+        if scaled is None:
+            scaled = scaler.transform(np.asarray(self.view(columns)))
+        self.scaled = AppendableRows(np.ascontiguousarray(scaled, dtype=np.float32))
+        self.scaled_columns = list(columns)
+        self.scaler = scaler
+
+    def index_clusters(self, clusters=None):
+        # Group rows by K-Means cluster for pruned nearest-neighbour search. clusters holds
+        # the rows, offsets and centers of a saved ClusterIndex, otherwise one is fitted
+        if clusters is None:
+            self.clusters = ClusterIndex.fit(self.scaled)
+        else:
+            self.clusters = ClusterIndex(self.scaled, clusters['rows'], clusters['offsets'], clusters['centers'])
+
+    def view(self, columns):
+        # Contiguous sub-matrix for a column subset, built once per subset
+        return self._cached_view(tuple(columns))
+
+    def _cached_view(self, key):
+        view = self._views.get(key)
+        if view is None:
+            view = AppendableRows(self._build_view(key, self.matrix.base))
+            if len(self.matrix.tail):
+                view = view.append(self._build_view(key, self.matrix.tail))
+            with self._views_lock:
+                view = self._views.setdefault(key, view)
+        return view
+
+    def _build_view(self, key, matrix):
+        unit = key[0] == 'unit'
+        columns = key[1:] if unit else key
+        view = np.ascontiguousarray(matrix[:, [self.columns.index(c) for c in columns]])
+        if unit:
+            view = view.astype(np.float32)
+            norms = np.linalg.norm(view, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            view /= norms
+        return view
+
+    def extended(self, frame):
+        # New snapshot with frame's rows appended, this one is left untouched for in-flight
+        # readers. Every per-row array, index and view only adds the new rows, so the cost
+        # is O(new rows) whatever the catalog size
+        first_row = len(self)
+        new_ids = frame['id'].tolist()
+        new_matrix = np.ascontiguousarray(frame[self.columns].to_numpy(dtype=np.float32, na_value=np.nan))
+
+        snapshot = copy.copy(self)
+        snapshot.ids = self.ids.append(id_array(new_ids))
+        snapshot.index = self.index.extended(new_ids)
+        snapshot.names, new_codes = self.names.extended(frame['name'].tolist())
+        snapshot.name_codes = self.name_codes.append(new_codes)
+        snapshot.matrix = self.matrix.append(new_matrix)
+        if self.artists is not None:
+            snapshot.artists = self.artists.extended(frame['artist_ids'].tolist())
+
+        # New rows are scaled with the fitted scaler, a full rebuild refits it
+        if self.scaled is not None:
+            new_scaled = self.scaler.transform(self._build_view(tuple(self.scaled_columns), new_matrix))
+            snapshot.scaled = self.scaled.append(new_scaled.astype(np.float32))
+            if self.clusters is not None:
+                snapshot.clusters = self.clusters.extended(snapshot.scaled, np.arange(first_row, len(snapshot)))
+
+        snapshot._views = {key: view.append(self._build_view(key, new_matrix))
+                           for key, view in self._views.items()}
+        snapshot._views_lock = threading.Lock()
+        return snapshot
+
+class CatalogNotReady(RuntimeError):
+    pass
+
+class FeatureStore:
+    def __init__(self, columns=FEATURE_COLUMNS, wait_timeout=None):
+        self.columns = list(columns)
+        self.wait_timeout = wait_timeout
+        self.version = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def load(self, snapshot, scaler=None, scaled_columns=None, clusters=None, scaled=None, version=None,
+             views=None):
+        # Finish the new snapshot first, then swap it in so readers never see a half-built store.
+        # views are prebuilt view()/unit_view() matrices keyed like the snapshot's cache
+        if views:
+            snapshot._views.update((key, AppendableRows(view)) for key, view in views.items())
+        if scaler is not None:
+            snapshot.scale(scaler, scaled_columns, scaled)
+            snapshot.index_clusters(clusters)
+        with self._lock:
+            self._snapshot = snapshot
+            self.version = version
+        self._ready.set()
+        return snapshot
+
+    def append(self, frame):
+        # Add new songs to the current snapshot and swap the grown one in. Songs already
+        # in the catalog or missing any feature value are skipped
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return None
+
+            frame = frame.drop_duplicates('id')
+            frame = frame[snapshot.index.lookup(frame['id']) < 0]
+            frame = frame.dropna(subset=self.columns)
+            if frame.empty:
+                return snapshot
+
+            snapshot = snapshot.extended(frame.reset_index(drop=True))
+            self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self):
+        # Waits up to wait_timeout seconds while the catalog is still warming up
+        snapshot = self._snapshot
+        if snapshot is None:
+            self._ready.wait(self.wait_timeout)
+            snapshot = self._snapshot
+            if snapshot is None:
+                raise CatalogNotReady("Song catalog is still loading")
+        return snapshot
@@ -0,0 +1,70 @@
+import copy
+import numpy as np
+
+def id_array(ids):
+    # Fixed-width unicode array of string ids: one flat buffer that can be saved with
+    # np.save and memory-mapped, instead of an array of Python str objects
+    ids = list(ids)
+    return np.array(ids, dtype=str) if ids else np.empty(0, dtype='U1')
+
+class IdIndex:
+    # id -> row lookups by binary search over ids in sorted order, where order holds the
+    # row of each sorted position. Both are flat arrays, so workers can share them through
+    # a memory map instead of each building a dict over the whole catalog.
+    # Rows appended later are looked up in extra, a dict shared with the indexes extended
+    # from this one: each only trusts the rows below its own size
+    def __init__(self, ids, order=None):
+        self.ids = ids
+        self.order = np.argsort(ids, kind='stable') if order is None else order
+        self.extra = {}
+        self.size = len(ids)
+
+    def __len__(self):
+        return self.size
+
+    def _extra_row(self, key):
+        row = self.extra.get(key, -1)
+        return row if row < self.size else -1
+
+    def _base_rows(self, keys):
+        # Row of each key in ids, -1 where it isn't there
+        rows = np.full(len(keys), -1, dtype=np.intp)
+        if len(self.ids) == 0 or len(keys) == 0:
+            return rows
+        positions = np.searchsorted(self.ids, keys, sorter=self.order)
+        inside = positions < len(self.ids)
+        candidates = self.order[positions[inside]]
+        found = self.ids[candidates] == keys[inside]
+        rows[np.flatnonzero(inside)[found]] = candidates[found]
+        return rows
+
+    def lookup(self, keys):
+        # Row of each key (-1 when unknown), in the order given
+        keys = list(keys)
+        rows = np.full(len(keys), -1, dtype=np.intp)
+        strings = [i for i, key in enumerate(keys) if isinstance(key, str)]
+        if strings:
+            rows[strings] = self._base_rows(np.array([keys[i] for i in strings], dtype=str))
+        if self.extra:
+            for i in np.flatnonzero(rows < 0).tolist():
+                rows[i] = self._extra_row(keys[i]) if isinstance(keys[i], str) else -1
+        return rows
+
+    def rows(self, keys):
+        # Rows of the known keys, in the order given
+        rows = self.lookup(keys)
+        return rows[rows >= 0]
+
+    def __contains__(self, key):
+        return self.lookup([key])[0] >= 0
+
+    def extended(self, keys):
+        # New index that also maps keys to the rows after this one's; the sorted arrays
+        # are shared and this index keeps answering as before
+        index = copy.copy(self)
+        if len(self.extra) != self.size - len(self.ids):
+            # Another index was already extended from this one, keep only our own rows
+            index.extra = {key: row for key, row in self.extra.items() if row < self.size}
+        index.extra.update(zip(keys, range(self.size, self.size + len(keys))))
+        index.size = self.size + len(keys)
+        return index
@@ -0,0 +1,140 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from cache_utils import LRUCache, RedisCache, MISSING
+from metrics import registry
+
+class JobQueueFull(RuntimeError):
+    pass
+
+class Job:
+    # One submitted unit of work. state goes queued -> running -> done | failed;
+    # result and status_code are what the synchronous endpoint would have answered
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = 'queued'
+        self.result = None
+        self.status_code = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+    @staticmethod
+    def is_finished(job):
+        # For the dicts to_dict() returns
+        return job['state'] in ('done', 'failed')
+
+    def to_dict(self):
+        job = {'job_id': self.id, 'kind': self.kind, 'state': self.state, 'submitted_at': self.submitted_at}
+        if self.finished:
+            job.update(status_code=self.status_code, finished_at=self.finished_at)
+            if self.state == 'done':
+                job['result'] = self.result
+            else:
+                job['error'] = self.error
+        return job
+
+job_seconds = registry.histogram(
+    'tuneswipe_job_seconds', 'Background job time spent queued and running', ['kind', 'phase'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+class JobRunner:
+    # Bounded background pool for slow endpoints. At most max_workers jobs run at once and
+    # at most max_queued wait; beyond that submit() raises JobQueueFull so the caller can
+    # answer 429 instead of piling up work. Finished jobs are kept for result_ttl seconds.
+    # run(fn, args) wraps every job, e.g. to push an app context, and returns
+    # (result, status_code); exceptions become failed jobs with error_status(exception).
+    # Jobs run in the worker that accepted them; with a redis_client their state is
+    # also published there, so any worker can answer status() for them. Unfinished
+    # jobs expire from Redis after pending_ttl, in case their worker died
+    def __init__(self, run, error_status, max_workers=4, max_queued=64, result_ttl=300, max_jobs=10000,
+                 redis_client=None, pending_ttl=24 * 3600, poll_interval=0.1):
+        self.run = run
+        self.error_status = error_status
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.pending_ttl = pending_ttl
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='jobs')
+        # Unfinished jobs have no TTL here, result_ttl starts once they finish
+        self._jobs = LRUCache(max_size=max_jobs)
+        self._shared = RedisCache(redis_client, prefix='jobs:') if redis_client is not None else None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    def submit(self, kind, fn, *args):
+        with self._lock:
+            if self._queued >= self.max_queued:
+                raise JobQueueFull(f"{self._queued} jobs already queued")
+            self._queued += 1
+        job = Job(kind)
+        self._jobs.set(job.id, job)
+        self._publish(job, self.pending_ttl)
+        self._executor.submit(self._execute, job, fn, args)
+        return job
+
+    def _publish(self, job, ttl):
+        if self._shared is not None:
+            self._shared.set(job.id, job.to_dict(), ttl)
+
+    def status(self, job_id, wait=0):
+        # to_dict() of the job, waiting up to wait seconds for it to finish; None if unknown
+        job = self._jobs.get(job_id)
+        if job is not MISSING:
+            if wait > 0:
+                job.wait(wait)
+            return job.to_dict()
+        if self._shared is None:
+            return None
+
+        # Accepted by another worker: poll its published state
+        deadline = time.monotonic() + wait
+        while True:
+            state = self._shared.get(job_id)
+            if state is MISSING:
+                return None
+            remaining = deadline - time.monotonic()
+            if Job.is_finished(state) or remaining <= 0:
+                return state
+            time.sleep(min(self.poll_interval, remaining))
+
+    def depth(self):
+        with self._lock:
+            return {('queued',): self._queued, ('running',): self._running}
+
+    def _execute(self, job, fn, args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        job.started_at = time.time()
+        job.state = 'running'
+        self._publish(job, self.pending_ttl)
+        job_seconds.observe(job.started_at - job.submitted_at, job.kind, 'queued')
+        try:
+            job.result, job.status_code = self.run(fn, args)
+            job.state = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status_code = self.error_status(e)
+            job.state = 'failed'
+        finally:
+            job.finished_at = time.time()
+            job_seconds.observe(job.finished_at - job.started_at, job.kind, 'run')
+            with self._lock:
+                self._running -= 1
+            job._done.set()
+            # Keep the finished job for result_ttl from now, not from submission
+            self._jobs.set(job.id, job, self.result_ttl)
+            self._publish(job, self.result_ttl)
@@ -0,0 +1,104 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from cache_utils import LRUCache, RedisCache, TieredCache, MISSING, redis_client_from_env
+from metrics import stage
+
+LASTFM_URL = os.getenv('LASTFM_API_URL', "http://ws.audioscrobbler.com/2.0/")
+
+# Per-call timeout and retries, fan-out width and the overall budget of one batch
+LASTFM_TIMEOUT = float(os.getenv('LASTFM_TIMEOUT', 3))
+LASTFM_RETRIES = int(os.getenv('LASTFM_RETRIES', 2))
+LASTFM_BACKOFF = float(os.getenv('LASTFM_BACKOFF', 0.2))
+LASTFM_MAX_WORKERS = int(os.getenv('LASTFM_MAX_WORKERS', 8))
+LASTFM_BATCH_DEADLINE = float(os.getenv('LASTFM_BATCH_DEADLINE', 8))
+
+# Similar-artist lists barely change, failed lookups are retried much sooner
+SIMILAR_ARTISTS_TTL = int(os.getenv('LASTFM_CACHE_TTL', 7 * 24 * 3600))
+FAILED_LOOKUP_TTL = int(os.getenv('LASTFM_FAILURE_TTL', 300))
+
+def build_similar_artists_cache(redis_client=None, max_size=4096):
+    # In-process LRU, plus a Redis tier shared by all workers when a client is given
+    remote = None
+    if redis_client is not None:
+        remote = RedisCache(redis_client, prefix='lastfm:similar:', ttl=SIMILAR_ARTISTS_TTL)
+    return TieredCache(LRUCache(max_size=max_size, ttl=SIMILAR_ARTISTS_TTL), remote,
+                       promote_ttl=FAILED_LOOKUP_TTL)
+
+similar_artists_cache = build_similar_artists_cache(redis_client_from_env())
+
+# Keep-alive connections shared by every Last.fm call in this process
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_maxsize=LASTFM_MAX_WORKERS))
+session.mount('https://', HTTPAdapter(pool_maxsize=LASTFM_MAX_WORKERS))
+
+# Bounds the number of concurrent Last.fm calls across all requests
+executor = ThreadPoolExecutor(max_workers=LASTFM_MAX_WORKERS, thread_name_prefix='lastfm')
+
+def fetch_similar_artists(artist_name):
+    # Uncached Last.fm call, returns (payload, status_code)
+    params = {
+        "method": "artist.getsimilar",
+        "artist": artist_name,
+        "api_key": os.getenv('LASTFM_API_KEY'),
+        "format": "json",
+        "limit": 10
+    }
+
+    # Retry network errors, 429 and 5xx with exponential backoff, give up on other statuses
+    status = 502
+    for attempt in range(LASTFM_RETRIES + 1):
+        if attempt:
+            time.sleep(LASTFM_BACKOFF * 2 ** (attempt - 1))
+        try:
+            with stage('lastfm_call'):
+                response = session.get(LASTFM_URL, params=params, timeout=LASTFM_TIMEOUT)
+        except requests.RequestException:
+            status = 502
+            continue
+
+        status = response.status_code
+        if status == 200:
+            return response.json(), 200
+        if status != 429 and status < 500:
+            break
+
+    return None, status
+
+#Get Similar Artists with LastFM API
+def get_similar_artists(artist_name, cache=None):
+    if not artist_name:
+        return {"error": "Missing artist_name"}, 400
+
+    cache = similar_artists_cache if cache is None else cache
+    key = artist_name.lower()
+
+    # Both answers and failures are cached, failures with a shorter TTL
+    cached = cache.get(key)
+    if cached is MISSING:
+        payload, status = fetch_similar_artists(artist_name)
+        cached = {"status": status, "body": payload}
+        cache.set(key, cached, ttl=None if status == 200 else FAILED_LOOKUP_TTL)
+
+    if cached["status"] == 200:
+        return cached["body"]
+    return {"error": "Failed to fetch similar artists"}, cached["status"]
+
+def get_similar_artists_many(artist_names, deadline=None):
+    # Look up several artists concurrently. Whatever has not finished within the
+    # deadline is reported as a 504 failure so one slow artist can't stall the batch;
+    # those calls keep running in the background and still fill the cache
+    deadline = LASTFM_BATCH_DEADLINE if deadline is None else deadline
+    futures = {name: executor.submit(get_similar_artists, name) for name in dict.fromkeys(artist_names)}
+    wait(futures.values(), timeout=deadline)
+
+    results = {}
+    for name, future in futures.items():
+        if future.done() and future.exception() is None:
+            results[name] = future.result()
+        else:
+            future.cancel()
+            results[name] = {"error": "Failed to fetch similar artists"}, 504
+    return results
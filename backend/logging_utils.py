@@ -0,0 +1,56 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# Attributes every LogRecord has, anything else was passed with extra= and is logged as a field
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+class JSONFormatter(logging.Formatter):
+    # One JSON object per line: time, level, logger, message and the extra= fields
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the record into its message and drops exc_info, which
+    # would put tracebacks inside 'message'. Only merge the args here and leave the
+    # formatting, exception included, to the listener's JSONFormatter
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def configure_logging(name='tuneswipe', level=None, stream=None):
+    # Logger for the backend. Records below LOG_LEVEL are dropped before any formatting,
+    # the rest are queued and written by a background thread so requests never wait on
+    # the output stream
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    logger.setLevel((level or os.getenv('LOG_LEVEL', 'INFO')).upper())
+    logger.propagate = False
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JSONFormatter())
+    records = queue.SimpleQueue()
+    logger.addHandler(RecordQueueHandler(records))
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return logger
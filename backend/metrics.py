@@ -0,0 +1,117 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow Last.fm batches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+class Histogram:
+    # Prometheus histogram, one series per combination of label values.
+    # Observing is a lock and a few additions, cheap enough for every request
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = format_labels(self.label_names, labels, [('le', format_value(bound))])
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            label_text = format_labels(self.label_names, labels)
+            lines.append(f'{self.name}_sum{label_text} {format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {count}')
+        return lines
+
+class Gauge:
+    # Value read from a callback at scrape time, e.g. a cache size.
+    # callback returns a number, or a dict of label value tuples -> number
+    def __init__(self, name, documentation, callback, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.label_names = tuple(label_names)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        try:
+            values = self.callback()
+        except Exception:
+            return lines  # Nothing to report yet (e.g. catalog still loading)
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{format_labels(self.label_names, labels)} {format_value(value)}')
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, callback, label_names=()):
+        metric = Gauge(name, documentation, callback, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        # Prometheus text exposition format
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+# Metrics of this worker process, served on /metrics
+registry = Registry()
+
+request_seconds = registry.histogram(
+    'tuneswipe_request_seconds', 'Request latency by endpoint', ['endpoint', 'method', 'status'])
+stage_seconds = registry.histogram(
+    'tuneswipe_stage_seconds', 'Time spent in each stage of the hot paths', ['stage'])
+
+def stage(name):
+    # with stage('distance'): ...  times a block into tuneswipe_stage_seconds
+    return stage_seconds.time(name)
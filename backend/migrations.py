@@ -0,0 +1,39 @@
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+log = logging.getLogger('tuneswipe.migrations')
+
+# Indexes the hot queries rely on. IF NOT EXISTS keeps every statement safe to rerun
+INDEXES = [
+    # check_songs: songs.artists && :names
+    "CREATE INDEX IF NOT EXISTS songs_artists_gin ON songs USING GIN (artists)",
+    # songs by artist id
+    "CREATE INDEX IF NOT EXISTS songs_artist_ids_gin ON songs USING GIN (artist_ids)",
+    # check_songs: artists.artist_name IN (...)
+    "CREATE INDEX IF NOT EXISTS artists_artist_name_idx ON artists (artist_name)",
+]
+
+TRIGRAM_INDEXES = [
+    # /song-search and /artist-search fall back to ILIKE '%query%' while the in-process
+    # search index is building, trigram indexes keep that off a sequential scan
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS songs_name_trgm ON songs USING GIN (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS artists_artist_name_trgm ON artists USING GIN (artist_name gin_trgm_ops)",
+]
+
+def ensure_indexes(engine, statements=INDEXES, optional=TRIGRAM_INDEXES):
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+    created = len(statements)
+
+    # pg_trgm comes with the contrib package, which not every server has installed
+    try:
+        with engine.begin() as connection:
+            for statement in optional:
+                connection.execute(text(statement))
+        created += len(optional)
+    except DBAPIError as e:
+        log.warning("Skipping trigram indexes: %s", e.orig)
+    return created
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import joblib
+import numpy as np
+import pandas as pd
+from feature_store import FeatureSnapshot
+from name_table import NameTable
+
+# Saved catalog + fitted model, one directory per catalog version:
+#   <directory>/<version>/{ids.npy, id_order.npy, name_codes.npy, names.npy, name_offsets.npy,
+#                          features.npy, scaled.npy, cluster-*.npy, artists.joblib,
+#                          pipeline.joblib, view-*.npy, meta.json}
+# and <directory>/CURRENT naming the version workers should load. Tracks ingested by any
+# worker are saved to one log shared by all versions, <directory>/deltas/<seq>.pkl with
+# increasing sequence numbers; each version's meta.json records the last delta it covers.
+# A version directory is never modified once written: every build gets a fresh version,
+# is written to a temporary directory and renamed into place, so workers can map the
+# .npy files (and the arrays inside artists.joblib) read-only and share them
+CURRENT_FILE = 'CURRENT'
+DELTA_DIR = 'deltas'
+# Bumped whenever the files or their contents change, older versions are rebuilt
+ARTIFACT_FORMAT = 5
+# Older versions kept next to CURRENT. Removing one is safe for workers still mapping it,
+# the files stay readable until they are unmapped
+KEEP_VERSIONS = 3
+
+def view_file(columns, unit):
+    digest = hashlib.md5(','.join(columns).encode()).hexdigest()[:12]
+    return f"view-{'unit-' if unit else ''}{digest}.npy"
+
+def catalog_version(ids):
+    # Changes whenever songs are added or removed
+    digest = hashlib.md5()
+    for song_id in sorted(ids.tolist()):
+        digest.update(song_id.encode())
+        digest.update(b'\0')
+    return f"{len(ids)}-{digest.hexdigest()[:12]}"
+
+def prune_versions(directory, keep=KEEP_VERSIONS):
+    # Remove all but the newest keep version directories. Temporary ones are left alone,
+    # another process may still be writing them
+    current = current_version(directory)
+    versions = [entry for entry in os.scandir(directory)
+                if entry.is_dir() and not entry.name.startswith('.') and entry.name != current
+                and os.path.exists(os.path.join(entry.path, 'meta.json'))]
+    versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[max(keep - 1, 0):]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+    # Deltas every kept version already covers are no longer needed. The newest one is
+    # always kept so sequence numbers never restart
+    covered = [version_delta_seq(entry.path) for entry in versions[:max(keep - 1, 0)]]
+    if current is not None:
+        covered.append(version_delta_seq(os.path.join(directory, current)))
+    if covered:
+        for seq in delta_seqs(directory):
+            if seq < min(covered):
+                try:
+                    os.remove(delta_path(directory, seq))
+                except FileNotFoundError:
+                    pass
+
+def version_delta_seq(version_dir):
+    try:
+        with open(os.path.join(version_dir, 'meta.json')) as f:
+            return json.load(f).get('delta_seq', 0)
+    except (OSError, ValueError):
+        return 0
+
+def save_artifacts(directory, catalog, pipeline, views=(), delta_seq=0):
+    # catalog is a freshly built FeatureSnapshot (nothing appended). views lists column
+    # subsets whose catalog.view() and catalog.unit_view() are saved too, so workers map
+    # them instead of rebuilding them. delta_seq is the last delta whose tracks are in the
+    # catalog, i.e. last_delta_seq() taken before the songs were read
+    # Unique per build, so a refit of the same songs never rewrites files workers have mapped
+    version = f"{catalog_version(np.asarray(catalog.ids))}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(directory, exist_ok=True)
+    version_dir = os.path.join(directory, f".{version}.tmp")
+    os.makedirs(version_dir)
+
+    np.save(os.path.join(version_dir, 'ids.npy'), catalog.ids)
+    np.save(os.path.join(version_dir, 'id_order.npy'), catalog.index.order)
+    np.save(os.path.join(version_dir, 'name_codes.npy'), catalog.name_codes)
+    np.save(os.path.join(version_dir, 'names.npy'), catalog.names.data)
+    np.save(os.path.join(version_dir, 'name_offsets.npy'), catalog.names.offsets)
+    np.save(os.path.join(version_dir, 'features.npy'), catalog.matrix)
+    np.save(os.path.join(version_dir, 'scaled.npy'), catalog.scaled)
+    np.save(os.path.join(version_dir, 'cluster-rows.npy'), catalog.clusters.rows)
+    np.save(os.path.join(version_dir, 'cluster-offsets.npy'), catalog.clusters.offsets)
+    np.save(os.path.join(version_dir, 'cluster-centers.npy'), catalog.clusters.centers)
+    joblib.dump(catalog.artists, os.path.join(version_dir, 'artists.joblib'))
+    joblib.dump(pipeline, os.path.join(version_dir, 'pipeline.joblib'))
+
+    saved_views = []
+    for columns in views:
+        for unit in (False, True):
+            view = catalog.unit_view(columns) if unit else catalog.view(columns)
+            np.save(os.path.join(version_dir, view_file(columns, unit)), view)
+            saved_views.append({'columns': list(columns), 'unit': unit})
+
+    with open(os.path.join(version_dir, 'meta.json'), 'w') as f:
+        json.dump({'format': ARTIFACT_FORMAT, 'version': version, 'songs': len(catalog), 'views': saved_views,
+                   'delta_seq': delta_seq}, f)
+    os.rename(version_dir, os.path.join(directory, version))
+
+    # Point CURRENT at the new version only once every file is written
+    tmp_path = os.path.join(directory, f".{CURRENT_FILE}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+    prune_versions(directory)
+    return version
+
+def current_version(directory):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load_array(path, mmap_mode):
+    try:
+        return np.load(path, mmap_mode=mmap_mode)
+    except ValueError:
+        # Empty arrays can't be mapped
+        return np.load(path)
+
+def load_artifacts(directory, mmap=True):
+    # The saved catalog (a FeatureSnapshot), pipeline and scaled matrix, or None if nothing
+    # was built yet.
+    # Raises ValueError for a version saved in another format.
+    # With mmap the arrays are read-only memory maps: every worker loading the same
+    # version shares one copy through the page cache, and loading is nearly instant
+    version = current_version(directory)
+    if version is None:
+        return None
+
+    version_dir = os.path.join(directory, version)
+    mmap_mode = 'r' if mmap else None
+    with open(os.path.join(version_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"Artifacts {version} have format {meta.get('format')}, expected {ARTIFACT_FORMAT}")
+
+    views = {}
+    for view in meta.get('views', []):
+        key = (('unit',) if view['unit'] else ()) + tuple(view['columns'])
+        views[key] = load_array(os.path.join(version_dir, view_file(view['columns'], view['unit'])), mmap_mode)
+
+    def array(name):
+        return load_array(os.path.join(version_dir, name), mmap_mode)
+
+    catalog = FeatureSnapshot(
+        array('ids.npy'), NameTable(array('names.npy'), array('name_offsets.npy')), array('name_codes.npy'),
+        array('features.npy'), artists=joblib.load(os.path.join(version_dir, 'artists.joblib'), mmap_mode=mmap_mode),
+        id_order=array('id_order.npy'))
+    return {
+        'version': version,
+        'catalog': catalog,
+        'scaled': array('scaled.npy'),
+        'clusters': {name: array(f'cluster-{name}.npy') for name in ('rows', 'offsets', 'centers')},
+        'pipeline': joblib.load(os.path.join(version_dir, 'pipeline.joblib')),
+        'views': views,
+        'delta_seq': meta.get('delta_seq', 0),
+    }
+
+def delta_path(directory, seq):
+    return os.path.join(directory, DELTA_DIR, f"{seq:012d}.pkl")
+
+def delta_seqs(directory):
+    try:
+        names = os.listdir(os.path.join(directory, DELTA_DIR))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-4]) for name in names if name.endswith('.pkl') and name[:-4].isdigit())
+
+def last_delta_seq(directory):
+    seqs = delta_seqs(directory)
+    return seqs[-1] if seqs else 0
+
+def save_delta(directory, frame):
+    # Appends frame to the delta log, returns its sequence number. The file is written
+    # first and then linked under the next free number, so readers never see a partial
+    # delta and a number is only taken once every lower one exists
+    os.makedirs(os.path.join(directory, DELTA_DIR), exist_ok=True)
+    tmp_path = os.path.join(directory, DELTA_DIR, f".{uuid.uuid4().hex}.tmp")
+    frame.to_pickle(tmp_path)
+    try:
+        while True:
+            seq = last_delta_seq(directory) + 1
+            try:
+                os.link(tmp_path, delta_path(directory, seq))
+                return seq
+            except FileExistsError:
+                continue
+    finally:
+        os.remove(tmp_path)
+
+def load_deltas(directory, after=0):
+    # (seq, frame) of the deltas after sequence number after, oldest first
+    deltas = []
+    for seq in delta_seqs(directory):
+        if seq > after:
+            try:
+                deltas.append((seq, pd.read_pickle(delta_path(directory, seq))))
+            except FileNotFoundError:
+                # Pruned meanwhile, every kept version already covers it
+                continue
+    return deltas
@@ -0,0 +1,90 @@
+import copy
+import numpy as np
+
+class NameTable:
+    # The distinct song names, sorted, as one UTF-8 byte buffer plus offsets: the name of
+    # code c is data[offsets[c]:offsets[c + 1]]. Two flat arrays that workers can share
+    # through a memory map, where a pandas Categorical keeps a Python str per name.
+    # Names first seen after the table was built get codes after it, see extended(); the
+    # extra names are shared with the tables extended from this one, each only uses the
+    # first n_extra of them
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+        self.extra = []
+        self.extra_codes = {}
+        self.n_extra = 0
+
+    @classmethod
+    def from_names(cls, names):
+        # names must be distinct and sorted
+        encoded = [name.encode() for name in names]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def from_categorical(cls, names):
+        # (table, int32 codes) of a pandas Categorical, missing names get code -1
+        categories = names.categories.tolist()
+        order = np.argsort(np.array(categories, dtype=object), kind='stable') if categories else np.empty(0, np.intp)
+        # Re-code so codes follow the sorted table
+        recode = np.empty(len(categories) + 1, dtype=np.int32)
+        recode[order] = np.arange(len(categories), dtype=np.int32)
+        recode[-1] = -1
+        codes = recode[np.asarray(names.codes)]
+        return cls.from_names([categories[i] for i in order]), codes
+
+    @property
+    def base_size(self):
+        return len(self.offsets) - 1
+
+    def __len__(self):
+        return self.base_size + self.n_extra
+
+    def __getitem__(self, code):
+        if code >= self.base_size:
+            return self.extra[code - self.base_size]
+        return self.data[self.offsets[code]:self.offsets[code + 1]].tobytes().decode()
+
+    def tolist(self):
+        return [self[code] for code in range(len(self))]
+
+    def code(self, name):
+        # Code of name, or None when the table doesn't have it
+        code = self.extra_codes.get(name)
+        if code is not None and code < len(self):
+            return code
+        low, high = 0, self.base_size
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle] < name:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.base_size and self[low] == name else None
+
+    def extended(self, names):
+        # (table, int32 codes) for names, a new table when some of them are new.
+        # None/NaN names get code -1
+        table = self
+        codes = np.empty(len(names), dtype=np.int32)
+        for i, name in enumerate(names):
+            if not isinstance(name, str):
+                codes[i] = -1
+                continue
+            code = table.code(name)
+            if code is None:
+                if table is self:
+                    table = copy.copy(self)
+                    if len(self.extra) != self.n_extra:
+                        # Another table was already extended from this one
+                        table.extra = self.extra[:self.n_extra]
+                        table.extra_codes = {name: code for name, code in self.extra_codes.items()
+                                             if code < len(self)}
+                code = len(table)
+                table.extra.append(name)
+                table.extra_codes[name] = code
+                table.n_extra += 1
+            codes[i] = code
+        return table, codes
@@ -0,0 +1,119 @@
+import threading
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from cache_utils import LRUCache, RedisCache, MISSING
+
+class PreferenceModel:
+    # One user's like/dislike model: logistic regression on the standardized catalog
+    # features, updated with partial_fit as swipes come in instead of refit from scratch
+    def __init__(self, alpha=1e-3):
+        self.model = SGDClassifier(loss='log_loss', alpha=alpha, learning_rate='optimal', random_state=0)
+        self.swiped = {}  # song id -> liked, so resent swipes aren't learned twice
+        self.history = []  # the learned batches as [song id, liked] pairs, in order
+        self.batches = 0  # how many batches were learned, i.e. how far the history is replayed
+        self.lock = threading.Lock()
+
+    @property
+    def trained(self):
+        return hasattr(self.model, 'coef_')
+
+    def update(self, catalog, swipe_results):
+        # Learn from the swipes not seen before (or whose verdict changed), returns how many
+        new = {}
+        for item in swipe_results:
+            liked = bool(item['liked'])
+            if self.swiped.get(item['id']) != liked:
+                new[item['id']] = liked
+        if not new:
+            return 0
+        return self.learn(catalog, list(new.items()))
+
+    def learn(self, catalog, batch):
+        # One partial_fit on a batch of (song id, liked) pairs. Replaying the same
+        # batches in the same order gives the same model, which is how other workers
+        # catch up from the shared history. The batch is recorded even when none of its
+        # songs are in this catalog, so the history stays aligned with the shared one
+        new = dict(batch)
+        rows = catalog.rows(list(new))
+        with self.lock:
+            if len(rows):
+                # rows() skips unknown ids, so take the labels of the ids that were found
+                labels = np.array([new[song_id] for song_id in catalog.ids[rows]], dtype=np.int8)
+                self.model.partial_fit(catalog.scaled[rows], labels, classes=[0, 1])
+            self.swiped.update(new)
+            self.history.append([[song_id, liked] for song_id, liked in batch])
+            self.batches += 1
+        return len(rows)
+
+    def scores(self, catalog):
+        # Decision function over the whole resident scaled matrix in one matvec
+        with self.lock:
+            coef = self.model.coef_[0].astype(np.float32)
+            intercept = np.float32(self.model.intercept_[0])
+        return catalog.scaled @ coef + intercept
+
+    def swiped_ids(self):
+        return list(self.swiped)
+
+class PreferenceModels:
+    # Per-user models, least recently used ones are evicted past max_size. With a
+    # redis_client each user's learned batches are shared, and a worker that hasn't
+    # seen some of them replays them before using its model. Concurrent updates of one
+    # user from two workers keep the last saved history. The batch count is stored
+    # separately so an up-to-date worker only reads that, not the whole history
+    def __init__(self, max_size=10000, ttl=None, alpha=1e-3, redis_client=None):
+        self.alpha = alpha
+        self._models = LRUCache(max_size=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self._history = None
+        self._counts = None
+        if redis_client is not None:
+            self._history = RedisCache(redis_client, prefix='preferences:', ttl=ttl)
+            self._counts = RedisCache(redis_client, prefix='preferences-count:', ttl=ttl)
+
+    def _shared_count(self, user_id):
+        count = self._counts.get(user_id) if self._counts is not None else MISSING
+        return 0 if count is MISSING else count
+
+    def _catch_up(self, user_id, model, catalog):
+        if self._shared_count(user_id) <= model.batches:
+            return
+        history = self._history.get(user_id)
+        if history is MISSING:
+            return
+        for batch in history[model.batches:]:
+            model.learn(catalog, [(song_id, liked) for song_id, liked in batch])
+
+    def get(self, user_id, catalog):
+        model = self._models.get(user_id)
+        if model is MISSING:
+            if not self._shared_count(user_id):
+                return None
+            model = self.get_or_create(user_id, catalog)
+        else:
+            self._catch_up(user_id, model, catalog)
+        return model
+
+    def get_or_create(self, user_id, catalog):
+        with self._lock:
+            model = self._models.get(user_id)
+            if model is MISSING:
+                model = PreferenceModel(self.alpha)
+                self._models.set(user_id, model)
+        self._catch_up(user_id, model, catalog)
+        return model
+
+    def save(self, user_id, model):
+        # Publish the model's history for the other workers
+        if self._history is not None:
+            self._history.set(user_id, model.history)
+            self._counts.set(user_id, model.batches)
+
+    def delete(self, user_id):
+        self._models.delete(user_id)
+        if self._history is not None:
+            self._counts.delete(user_id)
+            self._history.delete(user_id)
+
+    def __len__(self):
+        return len(self._models)
@@ -0,0 +1,34 @@
+import numpy as np
+
+def top_k(scores, k, exclude=None):
+    # Row positions of the k highest scores, best first, in O(N) instead of a full sort.
+    # exclude is an optional boolean mask of rows that must not be returned
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    if exclude is not None:
+        scores = np.where(exclude, -np.inf, scores)
+        k = min(k, len(scores) - int(np.count_nonzero(exclude)))
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+def batch_top_k(matrix, queries, k, exclude_rows=None, chunk_bytes=64 * 1024 * 1024):
+    # Top-k rows of matrix @ query for many queries, scored with one matmul per chunk.
+    # Queries are processed in chunks so the score block stays under chunk_bytes.
+    # exclude_rows is an optional list (one entry per query) of row positions to skip
+    queries = np.asarray(queries, dtype=matrix.dtype)
+    chunk_size = max(1, chunk_bytes // max(1, len(matrix) * matrix.itemsize))
+
+    results = []
+    for start in range(0, len(queries), chunk_size):
+        scores = (matrix @ queries[start:start + chunk_size].T).T  # (chunk, n_rows)
+        for offset, user_scores in enumerate(scores):
+            if exclude_rows is not None:
+                user_scores[exclude_rows[start + offset]] = -np.inf
+                k_user = min(k, len(user_scores) - len(np.unique(exclude_rows[start + offset])))
+            else:
+                k_user = k
+            results.append(top_k(user_scores, k_user))
+    return results
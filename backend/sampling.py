@@ -0,0 +1,66 @@
+import random
+import threading
+
+def sample_ids(ids, k, exclude=None):
+    # Draw up to k distinct ids in O(k) expected time by picking random positions,
+    # skipping any id in exclude (e.g. songs the user has already seen)
+    n = len(ids)
+    exclude = set(exclude) if exclude else set()
+    if k <= 0 or n == 0:
+        return []
+
+    # When most of the pool is wanted or excluded, filtering once is cheaper than rejection
+    if k + len(exclude) > n // 2:
+        candidates = [song_id for song_id in ids if song_id not in exclude]
+        return random.sample(candidates, min(k, len(candidates)))
+
+    picked_rows = set()
+    sampled = []
+    while len(sampled) < k:
+        row = random.randrange(n)
+        if row in picked_rows:
+            continue
+        picked_rows.add(row)
+        if ids[row] not in exclude:
+            sampled.append(ids[row])
+    return sampled
+
+class IdPool:
+    # Primary keys of a table, loaded once on first use and kept in memory
+    def __init__(self, load_ids):
+        self._load_ids = load_ids
+        self._ids = None
+        self._known = None
+        self._lock = threading.Lock()
+
+    def ids(self):
+        ids = self._ids
+        if ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self._ids = list(self._load_ids())
+                ids = self._ids
+        return ids
+
+    def refresh(self):
+        # Drop the cached ids, the next sample reloads them
+        with self._lock:
+            self._ids = None
+            self._known = None
+
+    def add(self, ids):
+        # Adds the ids that aren't in the pool yet without reloading it and returns them.
+        # Appending in place keeps concurrent samples valid. Nothing is added while the
+        # pool isn't loaded, loading reads them from the table anyway
+        with self._lock:
+            if self._ids is None:
+                return []
+            if self._known is None:
+                self._known = set(self._ids)
+            added = [i for i in dict.fromkeys(ids) if i not in self._known]
+            self._known.update(added)
+            self._ids.extend(added)
+        return added
+
+    def sample(self, k, exclude=None):
+        return sample_ids(self.ids(), k, exclude)
@@ -0,0 +1,293 @@
+import bisect
+import copy
+import heapq
+import logging
+import threading
+import numpy as np
+from rapidfuzz import fuzz, process
+
+log = logging.getLogger('tuneswipe.search')
+
+# Upper bound on the names handed to RapidFuzz for one query
+MAX_CANDIDATES = 5000
+# Entries an index takes through extended() before it has to be rebuilt, as a fraction of
+# the ones it was built with: extending copies the side segment, which has to stay small
+EXTEND_FRACTION = 0.1
+
+def extend_room(built, added):
+    return added <= max(1000, EXTEND_FRACTION * built)
+
+def normalize(text):
+    return ' '.join(str(text).lower().split())
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class NameIndex:
+    # In-process search over a list of names: a sorted array for prefix autocomplete and a
+    # trigram inverted index for substring/fuzzy candidates, ranked with RapidFuzz.
+    # search() returns positions into the names list, best match first.
+    # Names added by extended() go to a small side segment searched alongside
+    def __init__(self, names):
+        self.names = [normalize(name) if name is not None else '' for name in names]
+
+        self._order = sorted(range(len(self.names)), key=self.names.__getitem__)
+        self._sorted = [self.names[i] for i in self._order]
+
+        postings = {}
+        for position, name in enumerate(self.names):
+            for gram in trigrams(name):
+                postings.setdefault(gram, []).append(position)
+        self._postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+
+        self._extra = []
+        self._extra_sorted = []
+        self._extra_postings = {}
+
+    def __len__(self):
+        return len(self.names) + len(self._extra)
+
+    @property
+    def n_extra(self):
+        return len(self._extra)
+
+    def name(self, position):
+        if position < len(self.names):
+            return self.names[position]
+        return self._extra[position - len(self.names)]
+
+    def extended(self, names):
+        # New index that also covers names, at the positions after this one's. The
+        # structures built for the original names are shared, only the side segment is
+        # copied and grown
+        index = copy.copy(self)
+        added = [(normalize(name) if name is not None else '', position)
+                 for position, name in enumerate(names, start=len(self))]
+        index._extra = self._extra + [name for name, _ in added]
+        index._extra_sorted = list(heapq.merge(self._extra_sorted, sorted(added)))
+        index._extra_postings = dict(self._extra_postings)
+        grams = {}
+        for name, position in added:
+            for gram in trigrams(name):
+                grams.setdefault(gram, []).append(position)
+        for gram, positions in grams.items():
+            index._extra_postings[gram] = index._extra_postings.get(gram, []) + positions
+        return index
+
+    def _postings_for(self, gram):
+        positions = self._postings.get(gram)
+        extra = self._extra_postings.get(gram)
+        if extra is None:
+            return positions
+        extra = np.array(extra, dtype=np.int32)
+        return extra if positions is None else np.concatenate([positions, extra])
+
+    def prefix_matches(self, query, limit):
+        start = bisect.bisect_left(self._sorted, query)
+        matches = []
+        for offset in range(start, min(start + limit, len(self._sorted))):
+            if not self._sorted[offset].startswith(query):
+                break
+            matches.append((self._sorted[offset], self._order[offset]))
+        if self._extra_sorted:
+            start = bisect.bisect_left(self._extra_sorted, (query,))
+            extra = []
+            for name, position in self._extra_sorted[start:start + limit]:
+                if not name.startswith(query):
+                    break
+                extra.append((name, position))
+            matches = list(heapq.merge(matches, extra))[:limit]
+        return [position for _, position in matches]
+
+    def _candidates(self, query):
+        # Names containing the query (all of its trigrams, then verified), or when there
+        # are none, names sharing its rarest trigrams so typos still find something
+        lists = sorted((self._postings_for(gram) for gram in trigrams(query)),
+                       key=lambda p: -1 if p is None else len(p))
+        if lists and lists[0] is not None:
+            found = lists[0]
+            for positions in lists[1:]:
+                found = np.intersect1d(found, positions, assume_unique=True)
+                if len(found) == 0:
+                    break
+            found = [p for p in found.tolist() if query in self.name(p)]
+            if found:
+                return found[:MAX_CANDIDATES]
+
+        fuzzy = [p for p in lists if p is not None]
+        if not fuzzy:
+            return []
+        candidates = np.unique(np.concatenate(fuzzy[:3]))
+        return candidates[:MAX_CANDIDATES].tolist()
+
+    def search(self, query, limit=50, prefix_only=False):
+        query = normalize(query)
+        if not query:
+            return []
+
+        prefix = self.prefix_matches(query, limit)
+        if prefix_only or len(query) < 3:
+            return prefix
+
+        candidates = list(dict.fromkeys(prefix + self._candidates(query)))
+        scores = process.extract(query, [self.name(p) for p in candidates], scorer=fuzz.WRatio,
+                                 limit=None, score_cutoff=50)
+
+        def rank(match):
+            _, score, i = match
+            name = self.name(candidates[i])
+            if name == query:
+                tier = 0
+            elif name.startswith(query):
+                tier = 1
+            elif (' ' + query) in name:
+                tier = 2  # a later word starts with the query
+            elif query in name:
+                tier = 3
+            else:
+                tier = 4
+            return tier, -score, len(name)
+
+        return [candidates[i] for _, _, i in sorted(scores, key=rank)[:limit]]
+
+class SongSearchIndex:
+    # NameIndex over the distinct song names of a catalog, each hit expands to the ids of
+    # every song with that name. name_codes index names, -1 for a missing name
+    def __init__(self, ids, name_codes, names):
+        codes = np.asarray(name_codes)
+        self.ids = ids
+        self.rows = np.argsort(codes, kind='stable')
+        self.offsets = np.searchsorted(codes[self.rows], np.arange(len(names) + 1))
+        self.names = NameIndex(names)
+        self.n_rows = len(codes)
+        # Rows appended after the index was built, per name code, see extended()
+        self.extra = {}
+
+    def extended(self, ids, name_codes, names):
+        # Index over a catalog grown from the one this index covers, which only appends
+        # rows and names: just the new ones are added. None once a rebuild is due
+        if not extend_room(len(self.rows), len(ids) - len(self.rows)):
+            return None
+        index = copy.copy(self)
+        index.ids = ids
+        index.names = self.names.extended([names[code] for code in range(len(self.names), len(names))])
+        index.extra = dict(self.extra)
+        new_rows = np.arange(self.n_rows, len(ids))
+        for row, code in zip(new_rows.tolist(), name_codes[new_rows].tolist()):
+            if code >= 0:
+                index.extra[code] = index.extra.get(code, ()) + (row,)
+        index.n_rows = len(ids)
+        return index
+
+    def search(self, query, limit=50, prefix_only=False):
+        song_ids = []
+        for code in self.names.search(query, limit, prefix_only):
+            if code + 1 < len(self.offsets):
+                song_ids.extend(self.ids[self.rows[self.offsets[code]:self.offsets[code + 1]]].tolist())
+            extra = self.extra.get(code)
+            if extra:
+                song_ids.extend(self.ids[list(extra)].tolist())
+            if len(song_ids) >= limit:
+                break
+        return song_ids[:limit]
+
+class ArtistSearchIndex:
+    def __init__(self, artist_ids, artist_names):
+        self.ids = list(artist_ids)
+        self.names = NameIndex(artist_names)
+        self._known = set(self.ids)
+        # Artists added by extended()
+        self._extra_ids = []
+        self._extra_known = set()
+
+    def extended(self, artist_ids, artist_names):
+        # Index that also covers the given artists, ones it already has are skipped.
+        # None once a rebuild is due
+        added = [(artist_id, name) for artist_id, name in zip(artist_ids, artist_names)
+                 if artist_id not in self._known and artist_id not in self._extra_known]
+        added = list(dict(added).items())
+        if not added:
+            return self
+        if not extend_room(len(self.ids), len(self._extra_ids) + len(added)):
+            return None
+        index = copy.copy(self)
+        index.names = self.names.extended([name for _, name in added])
+        index._extra_ids = self._extra_ids + [artist_id for artist_id, _ in added]
+        index._extra_known = self._extra_known | {artist_id for artist_id, _ in added}
+        return index
+
+    def search(self, query, limit=50, prefix_only=False):
+        n_ids = len(self.ids)
+        return [self.ids[position] if position < n_ids else self._extra_ids[position - n_ids]
+                for position in self.names.search(query, limit, prefix_only)]
+
+class BackgroundIndex:
+    # Builds an index for a source (e.g. a catalog snapshot) in a background thread.
+    # get() never blocks: it returns the last built index, possibly for an older
+    # source or None, while a rebuild for the new source runs.
+    # extend(index, built_for, source), when given, derives the index for source from the
+    # one built for built_for (e.g. a snapshot with a few rows appended) and returns None
+    # when only a full build will do
+    def __init__(self, build, extend=None):
+        self._build = build
+        self._extend = extend
+        self._index = None
+        self._built_for = None
+        self._building_for = None
+        # update() calls made while a build runs, applied to its result too
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def get(self, source):
+        with self._lock:
+            if source is not self._built_for and source is not self._building_for:
+                self._start(source)
+            return self._index
+
+    def _start(self, source):
+        self._building_for = source
+        self._pending = []
+        threading.Thread(target=self._run, args=(source,), name='search-index', daemon=True).start()
+
+    def update(self, function):
+        # Replaces the index with function(index), e.g. one with a few names added, without
+        # a rebuild. function must be safe to apply to an index that already has them,
+        # since it also runs on the result of a build in flight. A None result starts a
+        # full rebuild instead
+        with self._lock:
+            if self._building_for is not None:
+                self._pending.append(function)
+            if self._index is None:
+                return
+            index = function(self._index)
+            if index is not None:
+                self._index = index
+            elif self._building_for is None:
+                self._start(self._built_for)
+
+    def _run(self, source):
+        with self._lock:
+            previous, built_for = self._index, self._built_for
+        index = None
+        try:
+            if self._extend is not None and previous is not None:
+                index = self._extend(previous, built_for, source)
+            if index is None:
+                index = self._build(source)
+        except Exception:
+            log.exception("Failed to build search index")
+            index = None
+        with self._lock:
+            if self._building_for is source:
+                self._building_for = None
+                pending, self._pending = self._pending, []
+                if index is not None:
+                    rebuild = False
+                    for function in pending:
+                        updated = function(index)
+                        rebuild |= updated is None
+                        index = index if updated is None else updated
+                    self._index = index
+                    self._built_for = source
+                    if rebuild:
+                        self._start(source)
@@ -0,0 +1,49 @@
+import os
+from cache_utils import LRUCache, RedisCache, MISSING, redis_client_from_env
+
+# Per-user state kept between requests (e.g. the artists /recent-tracks received for
+# /random-artists). Entries expire after SESSION_TTL seconds, the in-process store
+# also evicts the least recently used users past SESSION_MAX_ENTRIES
+SESSION_TTL = int(os.getenv('SESSION_TTL', 24 * 3600))
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', 10000))
+
+class InProcessSessionStore:
+    # Only visible to this worker process, use RedisSessionStore when scaled out
+    def __init__(self, namespace, max_size=SESSION_MAX_ENTRIES, ttl=SESSION_TTL):
+        self.namespace = namespace
+        self._entries = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get(self, user_id):
+        value = self._entries.get(user_id)
+        return None if value is MISSING else value
+
+    def set(self, user_id, value):
+        self._entries.set(user_id, value)
+
+    def delete(self, user_id):
+        self._entries.delete(user_id)
+
+class RedisSessionStore:
+    # Shared by every worker. Values must be JSON serializable, the size bound is
+    # Redis' own maxmemory policy on top of the TTL
+    def __init__(self, client, namespace, ttl=SESSION_TTL):
+        self.namespace = namespace
+        self._entries = RedisCache(client, prefix=f'session:{namespace}:', ttl=ttl)
+
+    def get(self, user_id):
+        value = self._entries.get(user_id)
+        return None if value is MISSING else value
+
+    def set(self, user_id, value):
+        self._entries.set(user_id, value)
+
+    def delete(self, user_id):
+        self._entries.delete(user_id)
+
+def session_store(namespace, redis_client=None):
+    # Redis store when REDIS_URL (or a client) is given, in-process otherwise
+    if redis_client is None:
+        redis_client = redis_client_from_env()
+    if redis_client is not None:
+        return RedisSessionStore(redis_client, namespace)
+    return InProcessSessionStore(namespace)
@@ -0,0 +1,71 @@
+import hashlib
+import os
+from cache_utils import LRUCache, RedisCache, TieredCache, MISSING
+
+SONG_CACHE_TTL = int(os.getenv('SONG_CACHE_TTL', 3600))
+SONG_CACHE_MAX = int(os.getenv('SONG_CACHE_MAX', 50000))
+# Unknown ids are remembered for less time, they may be ingested any moment
+MISSING_SONG_TTL = int(os.getenv('MISSING_SONG_TTL', 60))
+# With Redis, local copies are kept briefly so other workers' invalidations show up soon
+SONG_CACHE_LOCAL_TTL = int(os.getenv('SONG_CACHE_LOCAL_TTL', 60))
+
+# Fields of /songs/<id> and of each /songs/by-ids item
+DETAIL_FIELDS = ['id', 'name', 'album', 'artist_ids', 'track_number', 'explicit', 'year']
+SUMMARY_FIELDS = ['id', 'name', 'album', 'artist_ids', 'year']
+
+class SongMetadataCache:
+    # Read-through cache of serialized song metadata keyed by song id. Each entry holds
+    # the JSON of both response shapes and an ETag, so hits never touch the ORM or
+    # re-serialize. load_rows(ids) returns dicts with DETAIL_FIELDS for the ids it finds,
+    # dumps turns a dict into JSON (the app's own json provider, so output matches jsonify)
+    def __init__(self, load_rows, dumps, redis_client=None, max_size=SONG_CACHE_MAX, ttl=SONG_CACHE_TTL):
+        self.load_rows = load_rows
+        self.dumps = dumps
+        remote = None
+        local_ttl = ttl
+        if redis_client is not None:
+            remote = RedisCache(redis_client, prefix='songs:meta:', ttl=ttl)
+            local_ttl = min(ttl, SONG_CACHE_LOCAL_TTL)
+        self.cache = TieredCache(LRUCache(max_size=max_size, ttl=local_ttl), remote,
+                                 promote_ttl=min(local_ttl, MISSING_SONG_TTL))
+
+    def entry(self, row):
+        detail = self.dumps({f: row[f] for f in DETAIL_FIELDS})
+        return {
+            'detail': detail,
+            'summary': self.dumps({f: row[f] for f in SUMMARY_FIELDS}),
+            'etag': hashlib.md5(detail.encode()).hexdigest()[:16],
+        }
+
+    def get_many(self, song_ids):
+        # id -> entry (None for unknown ids), misses are loaded with one query
+        entries = {}
+        misses = []
+        for song_id in dict.fromkeys(song_ids):
+            entry = self.cache.get(song_id)
+            if entry is MISSING:
+                misses.append(song_id)
+            else:
+                entries[song_id] = entry
+
+        if misses:
+            loaded = {row['id']: self.entry(row) for row in self.load_rows(misses)}
+            for song_id in misses:
+                entry = loaded.get(song_id)
+                self.cache.set(song_id, entry, None if entry is not None else MISSING_SONG_TTL)
+                entries[song_id] = entry
+        # In the order asked for
+        return {song_id: entries[song_id] for song_id in dict.fromkeys(song_ids)}
+
+    def get(self, song_id):
+        return self.get_many([song_id])[song_id]
+
+    def invalidate(self, song_ids):
+        for song_id in song_ids:
+            self.cache.delete(song_id)
+
+    def stats(self):
+        return self.cache.stats()
+
+def combined_etag(entries):
+    return hashlib.md5('|'.join(entry['etag'] for entry in entries).encode()).hexdigest()[:16]
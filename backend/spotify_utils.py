@@ -1,18 +1,88 @@
-def get_spotify_tracks_and_features(track_ids, sp):
-    # Spotify lets you fetch 50 tracks at once
-    tracks = []
-    features = {}
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+log = logging.getLogger('tuneswipe.spotify')
+
+# Spotify lets you fetch 50 tracks at once
+SPOTIFY_BATCH_SIZE = 50
+
+# Concurrent Spotify calls, and how many batches may be fetched ahead of the consumer
+SPOTIFY_MAX_WORKERS = int(os.getenv('SPOTIFY_MAX_WORKERS', 4))
+SPOTIFY_PREFETCH = int(os.getenv('SPOTIFY_PREFETCH', SPOTIFY_MAX_WORKERS))
+
+# Retries after a 429 (waiting Retry-After seconds, capped) or a 5xx (backing off)
+SPOTIFY_RETRIES = int(os.getenv('SPOTIFY_RETRIES', 5))
+SPOTIFY_BACKOFF = float(os.getenv('SPOTIFY_BACKOFF', 0.5))
+SPOTIFY_MAX_RETRY_AFTER = float(os.getenv('SPOTIFY_MAX_RETRY_AFTER', 60))
+
+executor = ThreadPoolExecutor(max_workers=SPOTIFY_MAX_WORKERS, thread_name_prefix='spotify')
+
+def retry_delay(error, attempt):
+    # Seconds to wait before retrying a failed Spotify call, None if it shouldn't be retried.
+    # Works with spotipy.SpotifyException or anything with the same http_status/headers
+    status = getattr(error, 'http_status', None)
+    if status == 429:
+        headers = getattr(error, 'headers', None) or {}
+        try:
+            return min(float(headers.get('Retry-After', 1)), SPOTIFY_MAX_RETRY_AFTER)
+        except (TypeError, ValueError):
+            return 1.0
+    if status is not None and status >= 500:
+        return SPOTIFY_BACKOFF * 2 ** attempt
+    return None
 
-    for i in range(0, len(track_ids), 50):
-        batch = track_ids[i:i+50]
-        track_response = sp.tracks(batch)
-        feature_response = sp.audio_features(batch)
+def call_spotify(method, *args, sleep=time.sleep):
+    for attempt in range(SPOTIFY_RETRIES + 1):
+        try:
+            return method(*args)
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None or attempt == SPOTIFY_RETRIES:
+                raise
+            sleep(delay)
 
-        tracks.extend(track_response['tracks'])
-        for f in feature_response:
-            if f:  # Skip None
-                features[f['id']] = f
+def iter_spotify_batches(track_ids, sp, prefetch=None):
+    # Yields (tracks, features) for every batch of 50 ids, in order. The tracks and
+    # audio_features calls of a batch run in parallel, and up to prefetch batches are
+    # fetched ahead, so only a bounded number of batches is ever held in memory
+    prefetch = max(1, prefetch or SPOTIFY_PREFETCH)
+    pending = deque()
+    batches = (track_ids[i:i + SPOTIFY_BATCH_SIZE] for i in range(0, len(track_ids), SPOTIFY_BATCH_SIZE))
 
+    def submit(batch):
+        pending.append((executor.submit(call_spotify, sp.tracks, batch),
+                        executor.submit(call_spotify, sp.audio_features, batch)))
+
+    try:
+        for batch in batches:
+            submit(batch)
+            if len(pending) < prefetch:
+                continue
+            yield collect_batch(*pending.popleft())
+        while pending:
+            yield collect_batch(*pending.popleft())
+    finally:
+        # The consumer stopped early or a call failed, don't keep fetching
+        for futures in pending:
+            for future in futures:
+                future.cancel()
+
+def collect_batch(track_future, feature_future):
+    tracks = [t for t in track_future.result()['tracks'] if t]  # Skip ids Spotify doesn't know
+    features = {f['id']: f for f in feature_future.result() or [] if f}  # Skip None
+    return tracks, features
+
+def get_spotify_tracks_and_features(track_ids, sp):
+    tracks = []
+    features = {}
+    for batch_tracks, batch_features in iter_spotify_batches(track_ids, sp):
+        tracks.extend(batch_tracks)
+        features.update(batch_features)
     return tracks, features
 
 def format_track(track, features):
@@ -22,6 +92,7 @@ def format_track(track, features):
         "name": track["name"],
         "album": track["album"]["name"],
         "artist_ids": [artist["id"] for artist in track["artists"]],
+        "artists": [artist["name"] for artist in track["artists"]],
         "track_number": track["track_number"],
         "disc_number": track["disc_number"],
         "explicit": track["explicit"],
@@ -42,16 +113,110 @@ def format_track(track, features):
         "time_signature": audio.get("time_signature")
     }
 
-def store_tracks(tracks):
-    for t in tracks:
-        if not Song.query.get(t["id"]):
-            song = Song(**t)
-            db.session.add(song)
-    db.session.commit()
-    
+def format_artists(tracks):
+    # artists rows for every artist credited on the formatted tracks
+    artists = {}
+    for track in tracks:
+        for artist_id, artist_name in zip(track["artist_ids"], track["artists"]):
+            artists[artist_id] = {"artist_id": artist_id, "artist_name": artist_name}
+    return list(artists.values())
+
+# Rows per INSERT statement, each batch is its own transaction
+STORE_BATCH_SIZE = int(os.getenv('STORE_BATCH_SIZE', 1000))
+
+# Set by configure_storage, this module doesn't import the Flask app
+storage = {"engine": None, "songs": None, "artists": None}
+
+def configure_storage(engine, song_table, artist_table):
+    storage.update(engine=engine, songs=song_table, artists=artist_table)
+
+def upsert_rows(table, rows, update=False, batch_size=None):
+    # INSERT ... ON CONFLICT on the primary key, DO NOTHING or DO UPDATE with update=True.
+    # Returns {"inserted": n, "updated": n}
+    batch_size = batch_size or STORE_BATCH_SIZE
+    key = table.primary_key.columns.keys()[0]
+    columns = set(table.columns.keys())
+
+    # Later rows win, and a statement can't touch the same key twice
+    rows = {row[key]: {c: v for c, v in row.items() if c in columns} for row in rows}
+    rows = list(rows.values())
+
+    counts = {"inserted": 0, "updated": 0}
+    for i in range(0, len(rows), batch_size):
+        statement = insert(table).values(rows[i:i + batch_size])
+        if update:
+            excluded = statement.excluded
+            statement = statement.on_conflict_do_update(
+                index_elements=[key],
+                set_={c: excluded[c] for c in rows[i].keys() if c != key},
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=[key])
+        # xmax is 0 for a freshly inserted row and set for an updated one
+        statement = statement.returning(literal_column("xmax = 0"))
+
+        with storage["engine"].begin() as connection:
+            for (inserted,) in connection.execute(statement):
+                counts["inserted" if inserted else "updated"] += 1
+    return counts
+
+# Called with the song ids after every store_tracks write, e.g. to invalidate caches
+song_write_listeners = []
+# Called with the artist rows after every store_tracks write, e.g. to index new artists
+artist_write_listeners = []
+
+def store_tracks(tracks, artists=(), update=False, batch_size=None):
+    # Bulk insert formatted tracks (and their artists) at database speed. Existing songs
+    # are left alone unless update=True. Returns the inserted/updated counts per table
+    artists = list(artists)
+    counts = {
+        "songs": upsert_rows(storage["songs"], tracks, update, batch_size),
+        "artists": upsert_rows(storage["artists"], artists, update, batch_size),
+    }
+    song_ids = [t["id"] for t in tracks]
+    for listener in song_write_listeners:
+        listener(song_ids)
+    for listener in artist_write_listeners:
+        listener(artists)
+    return counts
+
+# Called with the formatted tracks after every store, e.g. to add them to in-memory catalogs
+track_listeners = []
+
+def iter_formatted_tracks(track_ids, sp):
+    # Formatted tracks as their batches arrive from Spotify
+    for tracks, features in iter_spotify_batches(track_ids, sp):
+        for track in tracks:
+            yield format_track(track, features)
+
+def ingest_spotify_tracks(track_ids, sp, batch_size=None, update=False, on_stored=None):
+    # Stream tracks from Spotify into the bulk writer, store_tracks runs every batch_size
+    # tracks so memory stays flat however long track_ids is. Returns the inserted/updated
+    # counts, on_stored (like the track_listeners) gets every stored batch
+    batch_size = batch_size or STORE_BATCH_SIZE
+    totals = {"songs": {"inserted": 0, "updated": 0}, "artists": {"inserted": 0, "updated": 0}}
+    listeners = track_listeners + ([on_stored] if on_stored else [])
+
+    def flush(formatted_tracks):
+        counts = store_tracks(formatted_tracks, format_artists(formatted_tracks), update)
+        for table, table_counts in counts.items():
+            for kind, n in table_counts.items():
+                totals[table][kind] += n
+        for listener in listeners:
+            listener(formatted_tracks)
+
+    batch = []
+    for track in iter_formatted_tracks(track_ids, sp):
+        batch.append(track)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    log.info("stored tracks", extra={"counts": totals})
+    return totals
+
 def fetch_and_store_spotify_tracks(track_ids, sp):
-    raw_tracks, audio_features = get_spotify_tracks_and_features(track_ids, sp)
-    formatted_tracks = [format_track(t, audio_features) for t in raw_tracks]
-    store_tracks(formatted_tracks)
+    formatted_tracks = []
+    ingest_spotify_tracks(track_ids, sp, on_stored=formatted_tracks.extend)
     return formatted_tracks
-
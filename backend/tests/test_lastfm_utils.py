@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+import lastfm_utils
+
+class StubLastFM(BaseHTTPRequestHandler):
+    # Answers artist.getsimilar according to the artist name:
+    #   slow-*   sleeps for server.delay before answering
+    #   flaky-*  fails with 503 until it has been asked server.failures times
+    #   missing-* 404
+    def do_GET(self):
+        artist = parse_qs(urlparse(self.path).query)['artist'][0]
+        with self.server.lock:
+            self.server.hits[artist] = self.server.hits.get(artist, 0) + 1
+            hits = self.server.hits[artist]
+
+        if artist.startswith('slow-'):
+            time.sleep(self.server.delay)
+        if artist.startswith('flaky-') and hits <= self.server.failures:
+            return self.reply(503, {'error': 'unavailable'})
+        if artist.startswith('missing-'):
+            return self.reply(404, {'error': 6, 'message': 'The artist you supplied could not be found'})
+        self.reply(200, {'similarartists': {'artist': [{'name': f'{artist} similar'}]}})
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def lastfm(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubLastFM)
+    server.daemon_threads = True
+    server.hits = {}
+    server.lock = threading.Lock()
+    server.delay = 1.0
+    server.failures = 1
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setattr(lastfm_utils, 'LASTFM_URL', f'http://127.0.0.1:{server.server_port}/2.0/')
+    monkeypatch.setattr(lastfm_utils, 'LASTFM_BACKOFF', 0.01)
+    monkeypatch.setattr(lastfm_utils, 'similar_artists_cache', lastfm_utils.build_similar_artists_cache())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_fetches_and_caches_similar_artists(lastfm):
+    results = lastfm_utils.get_similar_artists_many(['a', 'b', 'a'])
+
+    assert list(results) == ['a', 'b']
+    assert results['a'] == {'similarartists': {'artist': [{'name': 'a similar'}]}}
+    assert lastfm_utils.get_similar_artists('A') == results['a']
+    assert lastfm.hits == {'a': 1, 'b': 1}
+
+def test_retries_server_errors(lastfm):
+    results = lastfm_utils.get_similar_artists_many(['flaky-a'])
+
+    assert results['flaky-a'] == {'similarartists': {'artist': [{'name': 'flaky-a similar'}]}}
+    assert lastfm.hits['flaky-a'] == 2
+
+def test_gives_up_after_the_retries(lastfm):
+    lastfm.failures = 100
+    results = lastfm_utils.get_similar_artists_many(['flaky-b'])
+
+    assert results['flaky-b'] == ({'error': 'Failed to fetch similar artists'}, 503)
+    assert lastfm.hits['flaky-b'] == lastfm_utils.LASTFM_RETRIES + 1
+
+def test_caches_failed_lookups(lastfm):
+    first = lastfm_utils.get_similar_artists_many(['missing-a'])
+    second = lastfm_utils.get_similar_artists_many(['missing-a'])
+
+    # Client errors are not retried, and the failure is cached
+    assert first['missing-a'] == second['missing-a'] == ({'error': 'Failed to fetch similar artists'}, 404)
+    assert lastfm.hits['missing-a'] == 1
+
+def test_deadline_returns_partial_results(lastfm):
+    start = time.perf_counter()
+    results = lastfm_utils.get_similar_artists_many(['slow-a', 'b'], deadline=0.2)
+
+    assert time.perf_counter() - start < lastfm.delay
+    assert results['slow-a'] == ({'error': 'Failed to fetch similar artists'}, 504)
+    assert results['b'] == {'similarartists': {'artist': [{'name': 'b similar'}]}}